@@ -0,0 +1,174 @@
+from datetime import date
+import logging
+from typing import Dict, List, Optional
+
+from app.firestore import get_all_rooms, get_bookable_rooms, get_bookings_in_range
+from app.intervals import Interval, fits, free_gaps, gap_containing, ordinal_to_str, to_ordinal
+from app.models import Room
+
+# Khởi tạo logger
+logger = logging.getLogger(__name__)
+
+# Số ngày tối đa được dời trước/sau so với yêu cầu
+DEFAULT_FLEX_DAYS = 3
+# Số gợi ý tối đa trả về
+DEFAULT_LIMIT = 5
+
+# Điểm cơ sở cho từng loại gợi ý (càng nhỏ càng tốt)
+_KIND_BASE_SCORE = {"same_dates": 0, "shift": 1, "split": 10, "shorter": 20}
+# Điểm phạt khi khác loại phòng yêu cầu
+_OTHER_TYPE_PENALTY = 5
+
+def _room_info(room: Room, check_in: int, check_out: int) -> Dict:
+    return {
+        "room_id": room.id,
+        "name": room.name,
+        "type": room.type,
+        "check_in": ordinal_to_str(check_in),
+        "check_out": ordinal_to_str(check_out),
+    }
+
+def find_alternatives(check_in: str, check_out: str, room_id: Optional[str] = None,
+                      room_type: Optional[str] = None, flex_days: int = DEFAULT_FLEX_DAYS,
+                      limit: int = DEFAULT_LIMIT, property_id: Optional[str] = None) -> List[Dict]:
+    """
+    Tìm các phương án thay thế khi khoảng ngày (hoặc phòng) yêu cầu đã hết.
+    Chỉ dùng hai truy vấn: các phòng đang nhận đặt (cùng điều kiện với luồng
+    /book và create_booking, để không gợi ý phòng không đặt được) và toàn bộ
+    booking trong khoảng đã mở rộng ±flex_days, sau đó quét khoảng trống cho từng phòng.
+    Các loại gợi ý:
+        - same_dates: phòng khác còn trống đúng khoảng ngày (khi có room_id)
+        - shift: giữ nguyên số đêm, dời ngày trong phạm vi ±flex_days
+        - shorter: ở ngắn hơn, nằm trong khoảng ngày yêu cầu
+        - split: chia lượt ở cho hai phòng, đổi phòng giữa chừng
+    Có room_id/room_type thì phòng khác loại bị cộng _OTHER_TYPE_PENALTY điểm.
+    Trả về:
+    [{
+        "kind": "shift",
+        "check_in": "2024-12-26",
+        "check_out": "2024-12-28",
+        "rooms": [{"room_id": "101", "name": "Room 101", "type": "Family",
+                   "check_in": "2024-12-26", "check_out": "2024-12-28"}],
+        "score": 1
+    }]
+    """
+    try:
+        req_in = to_ordinal(check_in)
+        req_out = to_ordinal(check_out)
+        if req_out <= req_in:
+            raise ValueError("Ngày trả phòng phải sau ngày nhận phòng")
+
+        today = date.today().toordinal()
+        window_start = max(req_in - flex_days, today)
+        window_end = req_out + flex_days
+
+        rooms = get_bookable_rooms(property_id)
+        if room_id and not room_type:
+            # Phòng yêu cầu có thể đang không nhận đặt, nên tra loại trong cả danh mục
+            room_type = next((r.type for r in get_all_rooms(property_id) if r.id == room_id), None)
+
+        busy: Dict[str, List[Interval]] = {r.id: [] for r in rooms}
+        for booking in get_bookings_in_range(ordinal_to_str(window_start), ordinal_to_str(window_end), property_id):
+            if booking.room_id in busy:
+                busy[booking.room_id].append(
+                    (to_ordinal(booking.check_in), to_ordinal(booking.check_out))
+                )
+
+        room_gaps = {}
+        for room in rooms:
+            gaps = free_gaps(busy[room.id], window_start, window_end)
+            room_gaps[room.id] = (gaps, [g[0] for g in gaps])
+
+        # Phòng khác loại vẫn được gợi ý nhưng xếp sau phòng cùng loại
+        def penalty(room: Room) -> int:
+            if room_id and room.id == room_id:
+                return -1
+            return _OTHER_TYPE_PENALTY if room_type and room.type != room_type else 0
+
+        suggestions = []
+        nights = req_out - req_in
+        fully_free = {
+            r.id for r in rooms if fits(*room_gaps[r.id], req_in, req_out)
+        }
+
+        # Phòng khác còn trống đúng khoảng ngày (khi khách yêu cầu phòng cụ thể)
+        for room in rooms:
+            if room.id in fully_free and room.id != room_id:
+                suggestions.append({
+                    "kind": "same_dates",
+                    "check_in": check_in,
+                    "check_out": check_out,
+                    "rooms": [_room_info(room, req_in, req_out)],
+                    "score": _KIND_BASE_SCORE["same_dates"] + penalty(room),
+                })
+
+        # Dời ngày, giữ nguyên số đêm (ưu tiên độ lệch nhỏ)
+        for offset in range(1, flex_days + 1):
+            for delta in (offset, -offset):
+                start, end = req_in + delta, req_out + delta
+                if start < window_start or end > window_end:
+                    continue
+                for room in rooms:
+                    if fits(*room_gaps[room.id], start, end):
+                        suggestions.append({
+                            "kind": "shift",
+                            "check_in": ordinal_to_str(start),
+                            "check_out": ordinal_to_str(end),
+                            "rooms": [_room_info(room, start, end)],
+                            "score": _KIND_BASE_SCORE["shift"] + offset + penalty(room),
+                        })
+
+        # Ở ngắn hơn: đoạn trống dài nhất nằm trong khoảng yêu cầu
+        for room in rooms:
+            if room.id in fully_free:
+                continue
+            gaps, _ = room_gaps[room.id]
+            best = None
+            for gap_start, gap_end in gaps:
+                start, end = max(gap_start, req_in), min(gap_end, req_out)
+                if end - start >= 1 and (best is None or end - start > best[1] - best[0]):
+                    best = (start, end)
+            if best:
+                suggestions.append({
+                    "kind": "shorter",
+                    "check_in": ordinal_to_str(best[0]),
+                    "check_out": ordinal_to_str(best[1]),
+                    "rooms": [_room_info(room, best[0], best[1])],
+                    "score": _KIND_BASE_SCORE["shorter"] + (nights - (best[1] - best[0])) + penalty(room),
+                })
+
+        # Chia lượt ở cho hai phòng: phòng A từ check_in đến ngày đổi,
+        # phòng B từ ngày đổi đến check_out
+        reach_forward = {}
+        reach_back = {}
+        for room in rooms:
+            gaps, starts = room_gaps[room.id]
+            first = gap_containing(gaps, starts, req_in)
+            if first:
+                reach_forward[room.id] = min(first[1], req_out - 1)
+            last = gap_containing(gaps, starts, req_out)
+            if last:
+                reach_back[room.id] = max(last[0], req_in + 1)
+        rooms_by_id = {r.id: r for r in rooms}
+        for first_id, forward in reach_forward.items():
+            for second_id, back in reach_back.items():
+                if first_id == second_id or back > forward or first_id in fully_free:
+                    continue
+                first_room, second_room = rooms_by_id[first_id], rooms_by_id[second_id]
+                suggestions.append({
+                    "kind": "split",
+                    "check_in": check_in,
+                    "check_out": check_out,
+                    "rooms": [
+                        _room_info(first_room, req_in, back),
+                        _room_info(second_room, back, req_out),
+                    ],
+                    "score": _KIND_BASE_SCORE["split"] + penalty(first_room) + penalty(second_room),
+                })
+
+        suggestions.sort(key=lambda s: (s["score"], s["check_in"], s["rooms"][0]["room_id"]))
+        return suggestions[:limit]
+
+    except Exception as e:
+        logger.error(f"Lỗi khi tìm phương án thay thế: {str(e)}")
+        raise
@@ -0,0 +1,107 @@
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Callable, Dict, Hashable, Iterable, List, Optional
+
+from app.models import Room
+
+# Thời gian giữ danh mục phòng và kết quả phòng trống trong bộ nhớ (giây)
+ROOM_CATALOG_TTL = int(os.getenv("ROOM_CATALOG_TTL_SECONDS", "300"))
+AVAILABILITY_TTL = int(os.getenv("AVAILABILITY_CACHE_TTL_SECONDS", "60"))
+# Số khoảng ngày tối đa được cache cho mỗi cơ sở
+MAX_AVAILABILITY_ENTRIES = 256
+
+# Hàm được gọi mỗi khi phòng trống của một cơ sở thay đổi:
+# listener(property_id, room_ids) với room_ids=None nghĩa là có thể đổi mọi phòng
+_listeners: List[Callable[[str, Optional[frozenset]], None]] = []
+
+def on_availability_change(listener: Callable[[str, Optional[frozenset]], None]) -> None:
+    """Đăng ký listener cho thay đổi phòng trống (vd: câu trả lời inline tính sẵn)"""
+    _listeners.append(listener)
+
+class PropertyCache:
+    """
+    Cache riêng cho từng cơ sở (property): danh mục phòng và kết quả phòng
+    trống theo khoảng ngày. Bộ nhớ tỉ lệ với số phòng/khoảng ngày của chính
+    cơ sở đó; booking thay đổi ở cơ sở nào chỉ xóa cache của cơ sở đó.
+    Ngoài ra giữ kết quả phòng trống gần nhất của mỗi khoảng ngày (không hết
+    hạn, không bị xóa khi booking thay đổi) để dùng khi Firestore gặp sự cố.
+    Được dùng từ cả event loop lẫn thread của job dọn booking nên mọi truy
+    cập vào dữ liệu đều đi qua _lock.
+    """
+
+    def __init__(self, property_id: str):
+        self.property_id = property_id
+        self._rooms: Optional[List[Room]] = None
+        self._rooms_expires_at = 0.0
+        self._availability: "OrderedDict[Hashable, tuple]" = OrderedDict()
+        self._last_known: "OrderedDict[Hashable, List[Room]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get_rooms(self) -> Optional[List[Room]]:
+        with self._lock:
+            if self._rooms is not None and self._rooms_expires_at > time.monotonic():
+                return self._rooms
+            return None
+
+    def set_rooms(self, rooms: List[Room]) -> None:
+        with self._lock:
+            self._rooms = rooms
+            self._rooms_expires_at = time.monotonic() + ROOM_CATALOG_TTL
+
+    def get_availability(self, key: Hashable) -> Optional[List[Room]]:
+        with self._lock:
+            entry = self._availability.get(key)
+            if entry is None:
+                return None
+            expires_at, rooms = entry
+            if expires_at <= time.monotonic():
+                del self._availability[key]
+                return None
+            self._availability.move_to_end(key)
+            return rooms
+
+    def set_availability(self, key: Hashable, rooms: List[Room]) -> None:
+        with self._lock:
+            self._availability[key] = (time.monotonic() + AVAILABILITY_TTL, rooms)
+            self._availability.move_to_end(key)
+            while len(self._availability) > MAX_AVAILABILITY_ENTRIES:
+                self._availability.popitem(last=False)
+            self._last_known[key] = rooms
+            self._last_known.move_to_end(key)
+            while len(self._last_known) > MAX_AVAILABILITY_ENTRIES:
+                self._last_known.popitem(last=False)
+
+    def get_last_known(self, key: Hashable) -> Optional[List[Room]]:
+        """Kết quả gần nhất của khoảng ngày, có thể đã cũ"""
+        with self._lock:
+            return self._last_known.get(key)
+
+    def invalidate_availability(self, room_ids: Optional[Iterable[str]] = None) -> None:
+        """Xóa kết quả phòng trống; room_ids là các phòng có booking thay đổi (nếu biết)"""
+        with self._lock:
+            self._availability.clear()
+        # Gọi listener ngoài lock để listener có thể đọc lại cache
+        self._notify(frozenset(room_ids) if room_ids is not None else None)
+
+    def invalidate(self) -> None:
+        with self._lock:
+            self._rooms = None
+            self._availability.clear()
+            self._last_known.clear()
+        self._notify(None)
+
+    def _notify(self, room_ids: Optional[frozenset]) -> None:
+        for listener in _listeners:
+            listener(self.property_id, room_ids)
+
+_caches: Dict[str, PropertyCache] = {}
+
+def get_cache(property_id: str) -> PropertyCache:
+    """Lấy cache của một cơ sở (tạo mới nếu chưa có)"""
+    cache = _caches.get(property_id)
+    if cache is None:
+        # setdefault: thread khác có thể vừa tạo cache của cùng cơ sở
+        cache = _caches.setdefault(property_id, PropertyCache(property_id))
+    return cache
@@ -1,11 +1,15 @@
 import firebase_admin
 from firebase_admin import credentials, firestore
 from google.cloud.firestore_v1.base_query import FieldFilter
-from datetime import datetime
+from datetime import date, datetime, timedelta, timezone
 import json
 import os
 import logging
 from typing import Dict, List, Optional, Union
+from app.cache import get_cache
+from app.models import Booking, Room
+from app.parsing import to_date, to_vnd
+from app.resilience import firestore_breaker, guarded, mark_degraded, remaining_timeout
 
 # Khởi tạo logger
 logger = logging.getLogger(__name__)
@@ -26,50 +30,149 @@ def init_firestore():
         logger.error(f"Lỗi khởi tạo Firestore: {str(e)}")
         raise
 
+# ========== PROPERTY OPERATIONS ==========
+# Cơ sở mặc định dùng các collection gốc "rooms"/"bookings" (dữ liệu có sẵn),
+# các cơ sở khác dùng subcollection properties/{property_id}/rooms|bookings
+DEFAULT_PROPERTY_ID = os.getenv("DEFAULT_PROPERTY_ID", "hello-dalat")
+
+def _collection(name: str, property_id: Optional[str] = None):
+    """Collection `name` của một cơ sở"""
+    if not property_id or property_id == DEFAULT_PROPERTY_ID:
+        return db.collection(name)
+    return db.collection("properties").document(property_id).collection(name)
+
+# ========== GUARDED I/O ==========
+# Mọi lời gọi Firestore đi qua các hàm dưới đây: kiểm tra circuit breaker,
+# timeout rút ngắn theo deadline của update; thao tác đọc được hedge.
+FIRESTORE_TIMEOUT = float(os.getenv("FIRESTORE_TIMEOUT_SECONDS", "5"))
+
+@guarded(firestore_breaker, hedge=True)
+def _fetch(query) -> list:
+    """Đọc toàn bộ kết quả của một query"""
+    return list(query.stream(timeout=remaining_timeout(FIRESTORE_TIMEOUT)))
+
+@guarded(firestore_breaker, hedge=True)
+def _fetch_doc(ref, field_paths: Optional[List[str]] = None):
+    """Đọc một document"""
+    return ref.get(field_paths=field_paths, timeout=remaining_timeout(FIRESTORE_TIMEOUT))
+
+@guarded(firestore_breaker, hedge=True)
+def _fetch_all(refs) -> list:
+    """Đọc nhiều document trong một round trip"""
+    return list(db.get_all(refs, timeout=remaining_timeout(FIRESTORE_TIMEOUT)))
+
+@guarded(firestore_breaker)
+def _commit(batch) -> None:
+    """Commit một batch ghi (không hedge vì không idempotent)"""
+    batch.commit(timeout=remaining_timeout(FIRESTORE_TIMEOUT))
+
+@guarded(firestore_breaker)
+def _run_write(func, *args, **kwargs):
+    """Chạy một thao tác ghi/transaction qua circuit breaker"""
+    return func(*args, **kwargs)
+
+def get_properties() -> List[Dict]:
+    """Lấy danh sách cơ sở, luôn có cơ sở mặc định"""
+    try:
+        properties = [{"id": doc.id, **(doc.to_dict() or {})} for doc in _fetch(db.collection("properties"))]
+        if not any(p["id"] == DEFAULT_PROPERTY_ID for p in properties):
+            properties.insert(0, {"id": DEFAULT_PROPERTY_ID, "name": "Hello Dalat Hostel"})
+        return properties
+    except Exception as e:
+        logger.error(f"Lỗi khi lấy danh sách cơ sở: {str(e)}")
+        raise
+
+def get_chat_property_id(chat_id: int) -> Optional[str]:
+    """Cơ sở đang gắn với một chat (None nếu chưa gắn; lỗi Firestore được raise)"""
+    try:
+        doc = _fetch_doc(db.collection("chat_properties").document(str(chat_id)))
+        return doc.get("propertyId") if doc.exists else None
+    except Exception as e:
+        logger.error(f"Lỗi khi lấy cơ sở của chat {chat_id}: {str(e)}")
+        raise
+
+def set_chat_property_id(chat_id: int, property_id: str) -> None:
+    """Gắn một chat với cơ sở"""
+    try:
+        _run_write(db.collection("chat_properties").document(str(chat_id)).set, {
+            "propertyId": property_id,
+            "updatedAt": firestore.SERVER_TIMESTAMP
+        })
+    except Exception as e:
+        logger.error(f"Lỗi khi gắn chat {chat_id} với cơ sở {property_id}: {str(e)}")
+        raise
+
+def upsert_property(property_id: str, name: str, rooms: List[Dict]) -> None:
+    """Tạo/cập nhật một cơ sở cùng danh mục phòng của nó"""
+    try:
+        _run_write(db.collection("properties").document(property_id).set, {"name": name}, merge=True)
+        batch = db.batch()
+        for room in rooms:
+            batch.set(_collection("rooms", property_id).document(room["id"]), {
+                "name": room["name"],
+                "type": room["type"],
+                "status": room["status"],
+                "capacity": room["capacity"]
+            })
+        _commit(batch)
+        get_cache(property_id).invalidate()
+    except Exception as e:
+        logger.error(f"Lỗi khi khởi tạo cơ sở {property_id}: {str(e)}")
+        raise
+
 # ========== ROOM OPERATIONS ==========
-def get_room(room_id: str) -> Optional[Dict]:
+def _last_known_availability(error: Exception, key: tuple, property_id: Optional[str]) -> Optional[List[Room]]:
+    """
+    Chế độ dự phòng: khi Firestore lỗi/quá hạn/breaker mở, trả về kết quả phòng
+    trống gần nhất của khoảng ngày (nếu có) và đánh dấu update đang dùng dữ liệu cũ.
+    Transaction tạo booking vẫn kiểm tra lại phòng nên không thể đặt trùng.
+    """
+    if isinstance(error, ValueError):
+        return None
+    stale = get_cache(property_id or DEFAULT_PROPERTY_ID).get_last_known(key)
+    if stale is not None:
+        mark_degraded("firestore")
+        logger.warning(f"Dùng kết quả phòng trống gần nhất cho {key[1]} - {key[2]}")
+    return stale
+
+def get_room(room_id: str, property_id: Optional[str] = None) -> Optional[Room]:
     """Lấy thông tin phòng theo ID"""
     try:
-        doc = db.collection("rooms").document(room_id).get()
-        return doc.to_dict() if doc.exists else None
+        doc = _fetch_doc(_collection("rooms", property_id).document(room_id))
+        return Room.from_snapshot(doc) if doc.exists else None
     except Exception as e:
         logger.error(f"Lỗi khi lấy thông tin phòng {room_id}: {str(e)}")
         return None
 
-def get_available_rooms(check_in: str, check_out: str) -> List[Dict]:
+def get_available_rooms(check_in: str, check_out: str, property_id: Optional[str] = None) -> List[Room]:
     """Lấy danh sách phòng trống trong khoảng thời gian"""
     try:
         # Validate ngày
         datetime.strptime(check_in, "%Y-%m-%d")
         datetime.strptime(check_out, "%Y-%m-%d")
 
-        available_rooms = []
-        rooms_ref = db.collection("rooms").where(filter=FieldFilter("status", "==", "available"))
-        
-        for room in rooms_ref.stream():
-            # Kiểm tra lịch đặt phòng trùng
-            conflicting_bookings = db.collection("bookings").where(
-                filter=FieldFilter("roomId", "==", room.id)
-            ).where(
-                filter=FieldFilter("status", "in", ["confirmed", "pending"])
-            ).where(
-                filter=FieldFilter("checkOut", ">=", check_in)
-            ).where(
-                filter=FieldFilter("checkIn", "<=", check_out)
-            ).limit(1).stream()
+        cache = get_cache(property_id or DEFAULT_PROPERTY_ID)
+        cached = cache.get_availability(("available", check_in, check_out))
+        if cached is not None:
+            return cached
 
-            if not list(conflicting_bookings):
-                room_data = room.to_dict()
-                room_data["id"] = room.id
-                available_rooms.append(room_data)
+        # Một truy vấn booking cho cả khoảng thay vì một truy vấn cho mỗi phòng
+        occupied = {b.room_id for b in get_bookings_in_range(check_in, check_out, property_id)}
+        available_rooms = [
+            room for room in get_bookable_rooms(property_id) if room.id not in occupied
+        ]
 
+        cache.set_availability(("available", check_in, check_out), available_rooms)
         return available_rooms
 
     except Exception as e:
         logger.error(f"Lỗi khi lấy phòng trống: {str(e)}")
+        stale = _last_known_availability(e, ("available", check_in, check_out), property_id)
+        if stale is not None:
+            return stale
         raise
 
-def get_all_available_rooms(start_date: str, end_date: str) -> List[Dict]:
+def get_all_available_rooms(start_date: str, end_date: str, property_id: Optional[str] = None) -> List[Room]:
     """
     Lấy tất cả các phòng còn trống trong khoảng thời gian bất kỳ.
     Trả về danh sách phòng trống.
@@ -77,33 +180,102 @@ def get_all_available_rooms(start_date: str, end_date: str) -> List[Dict]:
     try:
         datetime.strptime(start_date, "%Y-%m-%d")
         datetime.strptime(end_date, "%Y-%m-%d")
-        available_rooms = []
-        rooms_ref = db.collection("rooms").stream()
-        for room in rooms_ref:
-            room_id = room.id
-            # Kiểm tra có booking trùng không
-            bookings_ref = db.collection("bookings").where(
-                filter=FieldFilter("roomId", "==", room_id)
-            ).where(
-                filter=FieldFilter("status", "in", ["confirmed", "pending"])
-            ).where(
-                filter=FieldFilter("checkOut", ">=", start_date)
-            ).where(
-                filter=FieldFilter("checkIn", "<=", end_date)
-            ).limit(1).stream()
-            if not list(bookings_ref):
-                room_data = room.to_dict()
-                room_data["id"] = room_id
-                available_rooms.append(room_data)
+
+        cache = get_cache(property_id or DEFAULT_PROPERTY_ID)
+        cached = cache.get_availability(("all", start_date, end_date))
+        if cached is not None:
+            return cached
+
+        occupied = {b.room_id for b in get_bookings_in_range(start_date, end_date, property_id)}
+        available_rooms = [room for room in get_all_rooms(property_id) if room.id not in occupied]
+
+        cache.set_availability(("all", start_date, end_date), available_rooms)
         return available_rooms
     except Exception as e:
         logger.error(f"Lỗi khi kiểm tra phòng trống toàn bộ: {str(e)}")
+        stale = _last_known_availability(e, ("all", start_date, end_date), property_id)
+        if stale is not None:
+            return stale
+        raise
+
+def get_all_rooms(property_id: Optional[str] = None) -> List[Room]:
+    """Lấy toàn bộ danh mục phòng của một cơ sở (cache theo cơ sở)"""
+    try:
+        cache = get_cache(property_id or DEFAULT_PROPERTY_ID)
+        rooms = cache.get_rooms()
+        if rooms is None:
+            rooms_ref = _collection("rooms", property_id).select(Room.LISTING_FIELDS)
+            rooms = [Room.from_snapshot(room) for room in _fetch(rooms_ref)]
+            cache.set_rooms(rooms)
+        return rooms
+    except Exception as e:
+        logger.error(f"Lỗi khi lấy danh mục phòng: {str(e)}")
+        raise
+
+def get_bookable_rooms(property_id: Optional[str] = None) -> List[Room]:
+    """
+    Các phòng đang nhận đặt mới (rooms.status == "available") - cùng điều kiện
+    mà get_available_rooms và create_booking áp dụng.
+    Cache cùng kết quả phòng trống nên bị xóa khi booking/trạng thái phòng thay đổi.
+    """
+    try:
+        cache = get_cache(property_id or DEFAULT_PROPERTY_ID)
+        rooms = cache.get_availability(("bookable",))
+        if rooms is None:
+            rooms_ref = _collection("rooms", property_id).where(
+                filter=FieldFilter("status", "==", "available")
+            ).select(Room.LISTING_FIELDS)
+            rooms = [Room.from_snapshot(room) for room in _fetch(rooms_ref)]
+            cache.set_availability(("bookable",), rooms)
+        return rooms
+    except Exception as e:
+        logger.error(f"Lỗi khi lấy danh sách phòng nhận đặt: {str(e)}")
+        raise
+
+def get_bookings_in_range(start_date: str, end_date: str, property_id: Optional[str] = None) -> List[Booking]:
+    """
+    Lấy tất cả booking đang giữ phòng (confirmed/pending) giao với khoảng
+    [start_date, end_date] chỉ bằng một truy vấn.
+    Firestore chỉ cho phép bất đẳng thức trên một field, nên lọc checkOut
+    trên server và lọc checkIn ở phía client.
+    """
+    try:
+        datetime.strptime(start_date, "%Y-%m-%d")
+        datetime.strptime(end_date, "%Y-%m-%d")
+        bookings_ref = _collection("bookings", property_id).where(
+            filter=FieldFilter("status", "in", ["confirmed", "pending"])
+        ).where(
+            filter=FieldFilter("checkOut", ">=", start_date)
+        ).select(Booking.SCHEDULE_FIELDS)
+
+        bookings = []
+        for doc in _fetch(bookings_ref):
+            booking = Booking.from_snapshot(doc)
+            if booking.check_in > end_date:
+                continue
+            bookings.append(booking)
+        return bookings
+    except Exception as e:
+        logger.error(f"Lỗi khi lấy booking trong khoảng {start_date} - {end_date}: {str(e)}")
         raise
 
 # ========== BOOKING OPERATIONS ==========
-def create_booking(booking_data: Dict) -> str:
+class RoomUnavailableError(ValueError):
+    """Phòng yêu cầu không nhận đặt; giữ lại phòng và ngày để gợi ý phương án khác"""
+
+    def __init__(self, room_id: str, check_in: str, check_out: str):
+        super().__init__(f"Phòng {room_id} đã được đặt!")
+        self.room_id = room_id
+        self.check_in = check_in
+        self.check_out = check_out
+
+def create_booking(booking_data: Dict, idempotency_keys: Optional[List[str]] = None,
+                   idempotency_ttl: int = 600, property_id: Optional[str] = None) -> str:
     """
     Tạo booking mới
+    Nếu có idempotency_keys: trong cùng transaction, key nào còn hạn thì trả
+    về booking đã tạo trước đó thay vì tạo booking trùng; ngược lại lưu key
+    vào collection "idempotency_keys" với hạn idempotency_ttl giây.
     Args:
         booking_data: {
             "room_id": str,
@@ -119,11 +291,19 @@ def create_booking(booking_data: Dict) -> str:
         ID của booking vừa tạo
     """
     @firestore.transactional
-    def _create_in_transaction(transaction, booking_ref, room_ref):
+    def _create_in_transaction(transaction, booking_ref, room_ref, key_refs):
+        # Booking đã được tạo bởi một request trùng trước đó
+        now = datetime.now(timezone.utc)
+        for key_doc in (transaction.get_all(key_refs) if key_refs else []):
+            if key_doc.exists and key_doc.get("expiresAt") > now:
+                return key_doc.get("bookingId")
+
         # Kiểm tra phòng còn trống
         room = transaction.get(room_ref)
         if room.get("status") != "available":
-            raise ValueError(f"Phòng {booking_data['room_id']} đã được đặt!")
+            raise RoomUnavailableError(
+                booking_data["room_id"], booking_data["check_in"], booking_data["check_out"]
+            )
 
         # Tạo booking
         transaction.set(booking_ref, {
@@ -142,6 +322,17 @@ def create_booking(booking_data: Dict) -> str:
         # Cập nhật trạng thái phòng
         transaction.update(room_ref, {"status": "booked"})
 
+        # Lưu idempotency key (có thể bật TTL policy của Firestore trên expiresAt)
+        for key_ref in key_refs:
+            transaction.set(key_ref, {
+                "bookingId": booking_ref.id,
+                "roomId": booking_data["room_id"],
+                "guestName": booking_data["guest_name"],
+                "deposit": booking_data["deposit"],
+                "expiresAt": now + timedelta(seconds=idempotency_ttl)
+            })
+        return booking_ref.id
+
     try:
         # Validate dữ liệu
         if not all(k in booking_data for k in ["room_id", "guest_name", "phone", 
@@ -152,27 +343,54 @@ def create_booking(booking_data: Dict) -> str:
         datetime.strptime(booking_data["check_in"], "%Y-%m-%d")
         datetime.strptime(booking_data["check_out"], "%Y-%m-%d")
 
-        booking_ref = db.collection("bookings").document()
-        room_ref = db.collection("rooms").document(booking_data["room_id"])
+        booking_ref = _collection("bookings", property_id).document()
+        room_ref = _collection("rooms", property_id).document(booking_data["room_id"])
+
+        key_refs = [db.collection("idempotency_keys").document(key) for key in idempotency_keys or []]
 
         transaction = db.transaction()
-        _create_in_transaction(transaction, booking_ref, room_ref)
+        booking_id = _run_write(_create_in_transaction, transaction, booking_ref, room_ref, key_refs)
 
-        logger.info(f"Tạo booking thành công: {booking_ref.id}")
-        return booking_ref.id
+        if booking_id != booking_ref.id:
+            logger.info(f"Bỏ qua request trùng, dùng lại booking {booking_id}")
+        else:
+            get_cache(property_id or DEFAULT_PROPERTY_ID).invalidate_availability([booking_data["room_id"]])
+            logger.info(f"Tạo booking thành công: {booking_id}")
+        return booking_id
 
     except Exception as e:
         logger.error(f"Lỗi khi tạo booking: {str(e)}")
         raise
 
-def check_availability(room_id: str, check_in: str, check_out: str) -> bool:
+def get_idempotency_record(keys: List[str]) -> Optional[Dict]:
+    """
+    Tìm booking đã tạo cho một trong các idempotency key (một round trip).
+    Trả về {"booking_id", "room_id", "guest_name", "deposit"} hoặc None.
+    """
+    try:
+        refs = [db.collection("idempotency_keys").document(key) for key in keys]
+        now = datetime.now(timezone.utc)
+        for doc in _fetch_all(refs):
+            if doc.exists and doc.get("expiresAt") > now:
+                return {
+                    "booking_id": doc.get("bookingId"),
+                    "room_id": doc.get("roomId"),
+                    "guest_name": doc.get("guestName"),
+                    "deposit": doc.get("deposit"),
+                }
+        return None
+    except Exception as e:
+        logger.error(f"Lỗi khi tra cứu idempotency key: {str(e)}")
+        return None
+
+def check_availability(room_id: str, check_in: str, check_out: str, property_id: Optional[str] = None) -> bool:
     """Kiểm tra phòng có trống không"""
     try:
         # Validate dates
         datetime.strptime(check_in, "%Y-%m-%d")
         datetime.strptime(check_out, "%Y-%m-%d")
 
-        bookings_ref = db.collection("bookings").where(
+        bookings_ref = _collection("bookings", property_id).where(
             filter=FieldFilter("roomId", "==", room_id)
         ).where(
             filter=FieldFilter("checkOut", ">=", check_in)
@@ -180,15 +398,19 @@ def check_availability(room_id: str, check_in: str, check_out: str) -> bool:
             filter=FieldFilter("checkIn", "<=", check_out)
         ).where(
             filter=FieldFilter("status", "in", ["confirmed", "pending"])
-        ).limit(1)
+        ).select(["checkIn"]).limit(1)
 
-        return not list(bookings_ref.stream())
+        return not _fetch(bookings_ref)
     except Exception as e:
         logger.error(f"Lỗi kiểm tra phòng trống: {str(e)}")
         raise
     
-def cancel_booking(booking_id: str) -> bool:
-    """Hủy booking và cập nhật trạng thái phòng"""
+def cancel_booking(booking_id: str, property_id: Optional[str] = None) -> bool:
+    """
+    Hủy booking và cập nhật trạng thái phòng.
+    Xóa luôn các idempotency key của booking trong cùng transaction, để gửi
+    lại đúng tin nhắn đặt phòng cũ sẽ tạo booking mới thay vì trả về booking đã hủy.
+    """
     @firestore.transactional
     def _cancel_in_transaction(transaction, booking_ref, room_ref):
         booking = transaction.get(booking_ref)
@@ -198,6 +420,15 @@ def cancel_booking(booking_id: str) -> bool:
         if booking.get("status") == "cancelled":
             return False  # Đã hủy rồi
 
+        # Đọc trước khi ghi (yêu cầu của transaction)
+        key_docs = list(transaction.get(
+            db.collection("idempotency_keys").where(
+                filter=FieldFilter("bookingId", "==", booking_ref.id)
+            ).select(["bookingId"])
+        ))
+        for key_doc in key_docs:
+            transaction.delete(key_doc.reference)
+
         # Cập nhật booking
         transaction.update(booking_ref, {
             "status": "cancelled",
@@ -209,18 +440,19 @@ def cancel_booking(booking_id: str) -> bool:
         return True
 
     try:
-        booking_ref = db.collection("bookings").document(booking_id)
-        booking = booking_ref.get()
+        booking_ref = _collection("bookings", property_id).document(booking_id)
+        booking = _fetch_doc(booking_ref, ["roomId"])
         
         if not booking.exists:
             raise ValueError(f"Booking {booking_id} không tồn tại")
 
-        room_ref = db.collection("rooms").document(booking.get("roomId"))
+        room_ref = _collection("rooms", property_id).document(booking.get("roomId"))
 
         transaction = db.transaction()
-        success = _cancel_in_transaction(transaction, booking_ref, room_ref)
+        success = _run_write(_cancel_in_transaction, transaction, booking_ref, room_ref)
 
         if success:
+            get_cache(property_id or DEFAULT_PROPERTY_ID).invalidate_availability([booking.get("roomId")])
             logger.info(f"Đã hủy booking {booking_id}")
         return success
 
@@ -228,78 +460,179 @@ def cancel_booking(booking_id: str) -> bool:
         logger.error(f"Lỗi khi hủy booking: {str(e)}")
         raise
 
-def update_booking(booking_id: str, updates: Dict) -> bool:
+# Các field được phép cập nhật và kiểu sau khi chuẩn hóa
+UPDATABLE_FIELDS = {
+    "guestName": str, "phone": str, "notes": str,
+    "checkIn": date, "checkOut": date,
+    "price": int, "deposit": int,
+}
+# Field ảo: dời cả checkIn và checkOut đi N ngày so với giá trị hiện tại
+SHIFT_FIELD = "shiftDays"
+# Số lần chạy lại transaction khi có tranh chấp ghi
+UPDATE_MAX_ATTEMPTS = int(os.getenv("UPDATE_MAX_ATTEMPTS", "5"))
+
+def _coerce_updates(updates: Dict, today: date) -> Dict:
+    """Kiểm tra field và chuẩn hóa kiểu giá trị (ngày -> YYYY-MM-DD, tiền -> int VND)"""
+    unknown = [field for field in updates if field not in UPDATABLE_FIELDS and field != SHIFT_FIELD]
+    if unknown or not updates:
+        raise ValueError(
+            "Chỉ được cập nhật các field: " + ", ".join(list(UPDATABLE_FIELDS) + [SHIFT_FIELD])
+        )
+    if SHIFT_FIELD in updates and ("checkIn" in updates or "checkOut" in updates):
+        raise ValueError(f"Không dùng {SHIFT_FIELD} cùng với checkIn/checkOut")
+
+    coerced = {}
+    for field, value in updates.items():
+        kind = UPDATABLE_FIELDS.get(field)
+        if field == SHIFT_FIELD:
+            try:
+                coerced[field] = int(str(value).strip())
+            except ValueError:
+                raise ValueError(f"{SHIFT_FIELD} phải là số ngày, ví dụ {SHIFT_FIELD}:2")
+        elif kind is date:
+            coerced[field] = to_date(value, today).strftime("%Y-%m-%d")
+        elif kind is int:
+            coerced[field] = to_vnd(value)
+            if coerced[field] < 0:
+                raise ValueError(f"{field} không hợp lệ: {value}")
+        else:
+            coerced[field] = str(value).strip()
+            if field == "guestName" and not coerced[field]:
+                raise ValueError("Tên khách không được để trống")
+    return coerced
+
+def update_bookings(changes: Dict[str, Dict], property_id: Optional[str] = None) -> Dict[str, Dict]:
     """
-    Cập nhật thông tin booking
+    Cập nhật nhiều booking, mỗi booking nhiều field, trong một transaction.
     Args:
-        updates: Dict các field cần cập nhật
-                (chỉ cho phép: guestName, phone, checkIn, checkOut, price, deposit, notes)
+        changes: {booking_id: {field: giá trị}} với field thuộc UPDATABLE_FIELDS
+                 hoặc shiftDays (dời cả kỳ ở N ngày, vd dời lịch cả đoàn)
+    Giá trị được chuẩn hóa trước (ngày dd/mm, dd/mm/yyyy; tiền "1tr5", "500k").
+    Trong transaction: đọc tất cả booking một lần, với booking đổi ngày thì
+    kiểm tra lại trùng lịch với các booking khác của cùng phòng (một truy vấn
+    mỗi phòng, tính cả các booking cùng được dời), rồi ghi tất cả một lần commit.
+    Transaction tự chạy lại khi tranh chấp (tối đa UPDATE_MAX_ATTEMPTS lần);
+    phần chuẩn hóa không bị lặp lại.
+    Returns:
+        {booking_id: các field đã ghi}
     """
-    allowed_fields = {
-        "guestName", "phone", "checkIn", "checkOut", 
-        "price", "deposit", "notes"
-    }
+    @firestore.transactional
+    def _update_in_transaction(transaction, refs, coerced):
+        snapshots = {doc.id: doc for doc in transaction.get_all(list(refs.values()))}
+
+        # Tính giá trị mới cho từng booking
+        written = {}
+        schedules = {}  # booking_id -> (roomId, checkIn, checkOut) sau khi cập nhật
+        for booking_id, fields in coerced.items():
+            doc = snapshots.get(booking_id)
+            if doc is None or not doc.exists:
+                raise ValueError(f"Booking {booking_id} không tồn tại")
+            current = doc.to_dict()
+            values = {k: v for k, v in fields.items() if k != SHIFT_FIELD}
+            if SHIFT_FIELD in fields:
+                delta = timedelta(days=fields[SHIFT_FIELD])
+                for key in ("checkIn", "checkOut"):
+                    values[key] = (datetime.strptime(current[key], "%Y-%m-%d") + delta).strftime("%Y-%m-%d")
+            check_in = values.get("checkIn", current["checkIn"])
+            check_out = values.get("checkOut", current["checkOut"])
+            moved = check_in != current["checkIn"] or check_out != current["checkOut"]
+            if moved and check_out <= check_in:
+                raise ValueError(f"Booking {booking_id}: ngày trả phòng phải sau ngày nhận phòng")
+            if current.get("status") in ("confirmed", "pending"):
+                schedules[booking_id] = (current["roomId"], check_in, check_out, moved)
+            written[booking_id] = values
+
+        # Kiểm tra trùng lịch cho các phòng có booking đổi ngày
+        moved_rooms = {room_id for room_id, _, _, moved in schedules.values() if moved}
+        for room_id in moved_rooms:
+            ours = {bid: (ci, co) for bid, (rid, ci, co, _) in schedules.items() if rid == room_id}
+            window_start = min(ci for ci, _ in ours.values())
+            others = _collection("bookings", property_id).where(
+                filter=FieldFilter("roomId", "==", room_id)
+            ).where(
+                filter=FieldFilter("status", "in", ["confirmed", "pending"])
+            ).where(
+                filter=FieldFilter("checkOut", ">=", window_start)
+            ).select(Booking.SCHEDULE_FIELDS)
+            occupied = [
+                (doc.id, doc.get("checkIn"), doc.get("checkOut"))
+                for doc in transaction.get(others) if doc.id not in coerced
+            ] + [(bid, ci, co) for bid, (ci, co) in ours.items()]
+            for booking_id, (ci, co) in ours.items():
+                if not schedules[booking_id][3]:
+                    continue
+                for other_id, other_ci, other_co in occupied:
+                    if other_id != booking_id and other_co >= ci and other_ci <= co:
+                        raise ValueError(
+                            f"Phòng {room_id} đã có booking {other_id} từ {other_ci} đến {other_co}, "
+                            f"không thể dời booking {booking_id} sang {ci} - {co}"
+                        )
+
+        for booking_id, values in written.items():
+            transaction.update(refs[booking_id], dict(values, updatedAt=firestore.SERVER_TIMESTAMP))
+        return written, moved_rooms
 
     try:
-        # Validate updates
-        if not any(field in allowed_fields for field in updates.keys()):
-            raise ValueError("Chỉ được cập nhật các field: " + ", ".join(allowed_fields))
-
-        # Validate ngày nếu có
-        if "checkIn" in updates:
-            datetime.strptime(updates["checkIn"], "%Y-%m-%d")
-        if "checkOut" in updates:
-            datetime.strptime(updates["checkOut"], "%Y-%m-%d")
-
-        booking_ref = db.collection("bookings").document(booking_id)
-        booking_ref.update(updates)
-        
-        logger.info(f"Cập nhật booking {booking_id} thành công")
-        return True
+        today = date.today()
+        coerced = {booking_id: _coerce_updates(updates, today) for booking_id, updates in changes.items()}
+        if not coerced:
+            raise ValueError("Không có booking nào để cập nhật")
+        refs = {booking_id: _collection("bookings", property_id).document(booking_id) for booking_id in coerced}
+
+        transaction = db.transaction(max_attempts=UPDATE_MAX_ATTEMPTS)
+        written, moved_rooms = _run_write(_update_in_transaction, transaction, refs, coerced)
+
+        if moved_rooms:
+            get_cache(property_id or DEFAULT_PROPERTY_ID).invalidate_availability(moved_rooms)
+        logger.info(f"Cập nhật {len(written)} booking thành công: {', '.join(written)}")
+        return written
 
     except Exception as e:
         logger.error(f"Lỗi khi cập nhật booking: {str(e)}")
         raise
 
-def get_booking(booking_id: str) -> Optional[Dict]:
+def update_booking(booking_id: str, updates: Dict, property_id: Optional[str] = None) -> bool:
+    """
+    Cập nhật thông tin một booking (xem update_bookings)
+    Args:
+        updates: Dict các field cần cập nhật
+                (chỉ cho phép: guestName, phone, checkIn, checkOut, price, deposit, notes, shiftDays)
+    """
+    update_bookings({booking_id: updates}, property_id)
+    return True
+
+def get_booking(booking_id: str, property_id: Optional[str] = None) -> Optional[Booking]:
     """Lấy thông tin booking theo ID"""
     try:
-        doc = db.collection("bookings").document(booking_id).get()
-        if doc.exists:
-            data = doc.to_dict()
-            data["id"] = doc.id
-            return data
-        return None
+        doc = _fetch_doc(_collection("bookings", property_id).document(booking_id), list(Booking.FIELD_MAP))
+        return Booking.from_snapshot(doc) if doc.exists else None
     except Exception as e:
         logger.error(f"Lỗi khi lấy booking {booking_id}: {str(e)}")
         return None
 
-def get_today_checkins() -> List[Dict]:
+def get_today_checkins(property_id: Optional[str] = None) -> List[Booking]:
     """Lấy danh sách check-in hôm nay"""
     try:
         today = datetime.now().strftime("%Y-%m-%d")
-        bookings = db.collection("bookings").where(
+        bookings = _collection("bookings", property_id).where(
             filter=FieldFilter("checkIn", "==", today)
         ).where(
             filter=FieldFilter("status", "in", ["confirmed", "pending"])
-        ).stream()
+        ).select(Booking.CHECKIN_FIELDS)
 
-        return [{"id": b.id, **b.to_dict()} for b in bookings]
+        return [Booking.from_snapshot(b) for b in _fetch(bookings)]
     except Exception as e:
         logger.error(f"Lỗi khi lấy danh sách check-in: {str(e)}")
         return []
-def get_room_availability(room_id: str, start_date: str, end_date: str) -> Dict:
+def get_room_availability(room_id: str, start_date: str, end_date: str,
+                          property_id: Optional[str] = None) -> Dict:
     """
     Kiểm tra lịch phòng trống trong khoảng thời gian bất kỳ
     Trả về:
     {
         "room_id": "room_101",
         "available": True/False,
-        "bookings": [{
-            "check_in": "2024-12-25",
-            "check_out": "2024-12-27",
-            "status": "confirmed"
-        }]
+        "bookings": [Booking(...), ...]  # chỉ có roomId/checkIn/checkOut/status
     }
     """
     try:
@@ -307,14 +640,14 @@ def get_room_availability(room_id: str, start_date: str, end_date: str) -> Dict:
         datetime.strptime(start_date, "%Y-%m-%d")
         datetime.strptime(end_date, "%Y-%m-%d")
 
-        room_ref = db.collection("rooms").document(room_id)
-        room = room_ref.get()
+        room_ref = _collection("rooms", property_id).document(room_id)
+        room = _fetch_doc(room_ref, ["status"])
         
         if not room.exists:
             raise ValueError("Phòng không tồn tại")
 
         # Lấy tất cả booking trong khoảng thời gian
-        bookings_ref = db.collection("bookings").where(
+        bookings_ref = _collection("bookings", property_id).where(
             filter=FieldFilter("roomId", "==", room_id)
         ).where(
             filter=FieldFilter("checkOut", ">=", start_date)
@@ -322,16 +655,9 @@ def get_room_availability(room_id: str, start_date: str, end_date: str) -> Dict:
             filter=FieldFilter("checkIn", "<=", end_date)
         ).where(
             filter=FieldFilter("status", "in", ["confirmed", "pending"])
-        ).stream()
-
-        bookings_data = []
-        for booking in bookings_ref:
-            booking_data = booking.to_dict()
-            bookings_data.append({
-                "check_in": booking_data["checkIn"],
-                "check_out": booking_data["checkOut"],
-                "status": booking_data["status"]
-            })
+        ).select(Booking.SCHEDULE_FIELDS)
+
+        bookings_data = [Booking.from_snapshot(booking) for booking in _fetch(bookings_ref)]
 
         return {
             "room_id": room_id,
@@ -341,4 +667,97 @@ def get_room_availability(room_id: str, start_date: str, end_date: str) -> Dict:
 
     except Exception as e:
         logger.error(f"Lỗi khi kiểm tra lịch phòng: {str(e)}")
-        raise
\ No newline at end of file
+        raise
+# ========== MAINTENANCE ==========
+# Firestore giới hạn 500 thao tác ghi mỗi batch
+MAX_BATCH_WRITES = 500
+
+def expire_stale_pending_bookings(ttl_seconds: int, page_size: int = 200,
+                                  property_id: Optional[str] = None) -> int:
+    """
+    Chuyển các booking "pending" tạo quá ttl_seconds sang "expired".
+    Duyệt theo trang (order_by createdAt + start_after), mỗi trang một batch ghi.
+    Cần composite index: bookings(status ASC, createdAt ASC).
+    Trả về số booking đã hết hạn.
+    """
+    try:
+        cutoff = datetime.now(timezone.utc) - timedelta(seconds=ttl_seconds)
+        page_size = min(page_size, MAX_BATCH_WRITES)
+        query = _collection("bookings", property_id).where(
+            filter=FieldFilter("status", "==", "pending")
+        ).where(
+            filter=FieldFilter("createdAt", "<", cutoff)
+        ).order_by("createdAt").select(["createdAt"]).limit(page_size)
+
+        expired = 0
+        last_doc = None
+        while True:
+            page = query.start_after(last_doc) if last_doc else query
+            docs = _fetch(page)
+            if not docs:
+                break
+            batch = db.batch()
+            for doc in docs:
+                batch.update(doc.reference, {
+                    "status": "expired",
+                    "expiredAt": firestore.SERVER_TIMESTAMP
+                })
+            _commit(batch)
+            expired += len(docs)
+            if len(docs) < page_size:
+                break
+            last_doc = docs[-1]
+
+        if expired:
+            get_cache(property_id or DEFAULT_PROPERTY_ID).invalidate_availability()
+            logger.info(f"Đã hết hạn {expired} booking pending ({property_id or DEFAULT_PROPERTY_ID})")
+        return expired
+    except Exception as e:
+        logger.error(f"Lỗi khi dọn booking pending: {str(e)}")
+        raise
+
+def reconcile_room_statuses(property_id: Optional[str] = None) -> int:
+    """
+    Đồng bộ rooms.status với booking thực tế: phòng có booking confirmed/pending
+    chưa trả phòng là "booked", ngược lại là "available".
+    Chỉ sửa phòng đang ở một trong hai trạng thái này. Trả về số phòng đã sửa.
+    """
+    try:
+        # Đọc phòng trước rồi mới đọc booking: booking được tạo/hủy xen giữa
+        # hai lần đọc vẫn dẫn tới trạng thái đúng theo lần đọc booking sau
+        rooms = _fetch(_collection("rooms", property_id).select(["status"]))
+
+        today = datetime.now().strftime("%Y-%m-%d")
+        active_bookings = _collection("bookings", property_id).where(
+            filter=FieldFilter("status", "in", ["confirmed", "pending"])
+        ).where(
+            filter=FieldFilter("checkOut", ">=", today)
+        ).select(["roomId"])
+        occupied = {booking.to_dict().get("roomId") for booking in _fetch(active_bookings)}
+
+        fixed = 0
+        batch = db.batch()
+        pending_writes = 0
+        for room in rooms:
+            status = room.to_dict().get("status")
+            if status not in ("available", "booked"):
+                continue
+            expected = "booked" if room.id in occupied else "available"
+            if status != expected:
+                batch.update(room.reference, {"status": expected})
+                pending_writes += 1
+                fixed += 1
+                if pending_writes == MAX_BATCH_WRITES:
+                    _commit(batch)
+                    batch = db.batch()
+                    pending_writes = 0
+        if pending_writes:
+            _commit(batch)
+
+        if fixed:
+            get_cache(property_id or DEFAULT_PROPERTY_ID).invalidate_availability()
+            logger.info(f"Đã đồng bộ trạng thái {fixed} phòng ({property_id or DEFAULT_PROPERTY_ID})")
+        return fixed
+    except Exception as e:
+        logger.error(f"Lỗi khi đồng bộ trạng thái phòng: {str(e)}")
+        raise
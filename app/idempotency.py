@@ -0,0 +1,102 @@
+import asyncio
+import hashlib
+import os
+import re
+import time
+import logging
+from collections import OrderedDict
+from typing import Awaitable, Callable, Dict, List, Optional, Tuple
+
+from app.firestore import get_idempotency_record
+
+# Khởi tạo logger
+logger = logging.getLogger(__name__)
+
+# Thời gian giữ idempotency key (giây)
+IDEMPOTENCY_TTL = int(os.getenv("IDEMPOTENCY_TTL_SECONDS", "600"))
+# Số key tối đa giữ trong bộ nhớ
+MAX_LOCAL_KEYS = 10000
+
+# key -> (thời điểm hết hạn, kết quả)
+_local: "OrderedDict[str, Tuple[float, Dict]]" = OrderedDict()
+# key -> future của request đang xử lý
+_inflight: Dict[str, asyncio.Future] = {}
+
+def make_keys(chat_id: int, update_id: Optional[int], text: str) -> List[str]:
+    """
+    Sinh idempotency key cho một tin nhắn đặt phòng:
+        - theo update_id: chặn Telegram gửi lại cùng một update
+        - theo nội dung đã chuẩn hóa trong cùng chat: chặn bấm/gửi hai lần
+    """
+    normalized = re.sub(r"\s+", " ", text).strip().lower()
+    digest = hashlib.sha256(f"{chat_id}:{normalized}".encode("utf-8")).hexdigest()[:32]
+    keys = [f"c_{digest}"]
+    if update_id is not None:
+        keys.insert(0, f"u_{update_id}")
+    return keys
+
+def _get_local(keys: List[str]) -> Optional[Dict]:
+    now = time.monotonic()
+    for key in keys:
+        entry = _local.get(key)
+        if entry is None:
+            continue
+        expires_at, result = entry
+        if expires_at > now:
+            return result
+        del _local[key]
+    return None
+
+def _put_local(keys: List[str], result: Dict) -> None:
+    expires_at = time.monotonic() + IDEMPOTENCY_TTL
+    for key in keys:
+        _local[key] = (expires_at, result)
+        _local.move_to_end(key)
+    while len(_local) > MAX_LOCAL_KEYS:
+        _local.popitem(last=False)
+
+def forget_booking(booking_id: str) -> None:
+    """Bỏ các key trong bộ nhớ đang trỏ tới booking (vd booking vừa bị hủy)"""
+    for key in [key for key, (_, result) in _local.items() if result["booking_id"] == booking_id]:
+        del _local[key]
+
+async def run_once(keys: List[str], create: Callable[[], Awaitable[Dict]]) -> Tuple[Dict, bool]:
+    """
+    Chạy `create` đúng một lần cho các key đã cho.
+    `create` trả về {"booking_id", "room_id", "guest_name", "deposit"}.
+    Trả về (kết quả, True nếu là request trùng).
+    Thứ tự tra cứu: bộ nhớ -> request đang chạy -> Firestore -> gọi create.
+    """
+    result = _get_local(keys)
+    if result is not None:
+        logger.info(f"Request trùng (bộ nhớ), booking {result['booking_id']}")
+        return result, True
+
+    for key in keys:
+        future = _inflight.get(key)
+        if future is not None:
+            return await asyncio.shield(future), True
+
+    loop = asyncio.get_running_loop()
+    future = loop.create_future()
+    for key in keys:
+        _inflight[key] = future
+    try:
+        result = get_idempotency_record(keys)
+        duplicate = result is not None
+        if duplicate:
+            logger.info(f"Request trùng (Firestore), booking {result['booking_id']}")
+        else:
+            result = await create()
+        _put_local(keys, result)
+        future.set_result(result)
+        return result, duplicate
+    except Exception as e:
+        future.set_exception(e)
+        # Tránh cảnh báo "exception was never retrieved" khi không có request trùng chờ
+        future.exception()
+        raise
+    finally:
+        for key in keys:
+            if _inflight.get(key) is future:
+                del _inflight[key]
@@ -0,0 +1,203 @@
+from collections import defaultdict
+from datetime import date, timedelta
+import logging
+import os
+import re
+import threading
+from typing import Dict, FrozenSet, List, Optional, Set, Tuple
+
+from app.cache import on_availability_change
+from app.firestore import get_all_available_rooms, get_all_rooms, get_bookings_in_range, get_room_availability
+from app.intervals import Interval, fits, free_gaps, ordinal_to_str, to_ordinal
+from app.models import Booking, Room
+from app.parsing import to_date
+from app.resilience import mark_degraded
+
+# Khởi tạo logger
+logger = logging.getLogger(__name__)
+
+# Số ngày nhận phòng (tính từ hôm nay) có câu trả lời tính sẵn
+INLINE_PRECOMPUTE_DAYS = int(os.getenv("INLINE_PRECOMPUTE_DAYS", "14"))
+# Số đêm tối đa của các khoảng tính sẵn
+INLINE_MAX_NIGHTS = int(os.getenv("INLINE_MAX_NIGHTS", "3"))
+# Thời gian Telegram được cache câu trả lời inline (giây)
+INLINE_CACHE_TIME = int(os.getenv("INLINE_CACHE_TIME_SECONDS", "60"))
+# Quá số phòng này thay đổi thì tính lại toàn bộ thay vì đọc lại từng phòng
+INCREMENTAL_MAX_ROOMS = 3
+
+# Token ngày: dd/mm, dd/mm/yyyy hoặc yyyy-mm-dd
+_DATE_TOKEN = re.compile(r"\d{1,2}/\d{1,2}(/\d{4})?|\d{4}-\d{2}-\d{2}")
+# Token đang gõ dở (vd "25/", "25/1") - bỏ qua thay vì coi là từ khóa
+_PARTIAL_DATE_TOKEN = re.compile(r"[\d/\-]*[/\-][\d/\-]*")
+
+class AnswerSet:
+    """
+    Câu trả lời tính sẵn của một cơ sở: phòng trống cho mọi ngày nhận phòng
+    trong INLINE_PRECOMPUTE_DAYS ngày tới, ở từ 1 đến INLINE_MAX_NIGHTS đêm.
+    Lịch trống của từng phòng được giữ trong bộ nhớ; booking thay đổi chỉ
+    đánh dấu phòng liên quan, lần truy vấn sau đọc lại lịch đúng các phòng đó.
+    """
+
+    def __init__(self, property_id: str):
+        self.property_id = property_id
+        self.built_for: Optional[date] = None
+        self.rooms: List[Room] = []
+        # room_id -> (các khoảng trống, ngày bắt đầu của từng khoảng)
+        self.gaps: Dict[str, Tuple[List[Interval], List[int]]] = {}
+        self.answers: Dict[Tuple[str, str], List[Room]] = {}
+        # Phòng cần đọc lại lịch; None = cần tính lại toàn bộ.
+        # Được đánh dấu cả từ thread khác (sweeper) nên đọc/ghi dưới _dirty_lock
+        self.dirty: Optional[Set[str]] = None
+        self._dirty_lock = threading.Lock()
+        self.metrics = {"rebuilds": 0, "room_refreshes": 0, "hits": 0, "misses": 0}
+
+    def mark_dirty(self, room_ids: Optional[FrozenSet[str]]) -> None:
+        with self._dirty_lock:
+            if room_ids is None or self.dirty is None:
+                self.dirty = None
+            else:
+                self.dirty = self.dirty | room_ids
+
+    def _window(self, today: date) -> Tuple[int, int]:
+        start = today.toordinal()
+        return start, start + INLINE_PRECOMPUTE_DAYS + INLINE_MAX_NIGHTS
+
+    def _set_room_gaps(self, room_id: str, bookings: List[Booking], window: Tuple[int, int]) -> None:
+        busy = [(to_ordinal(b.check_in), to_ordinal(b.check_out)) for b in bookings]
+        gaps = free_gaps(busy, *window)
+        self.gaps[room_id] = (gaps, [gap[0] for gap in gaps])
+
+    def _rebuild_answers(self, today: date) -> None:
+        answers = {}
+        for check_in in range(today.toordinal(), today.toordinal() + INLINE_PRECOMPUTE_DAYS):
+            for nights in range(1, INLINE_MAX_NIGHTS + 1):
+                answers[(ordinal_to_str(check_in), ordinal_to_str(check_in + nights))] = [
+                    room for room in self.rooms if fits(*self.gaps[room.id], check_in, check_in + nights)
+                ]
+        self.answers = answers
+
+    def refresh(self) -> None:
+        """Cập nhật câu trả lời nếu đã sang ngày mới hoặc có booking thay đổi"""
+        today = date.today()
+        with self._dirty_lock:
+            dirty, self.dirty = self.dirty, set()
+        try:
+            if (self.built_for != today or dirty is None or len(dirty) > INCREMENTAL_MAX_ROOMS
+                    or not dirty <= self.gaps.keys()):
+                self._rebuild(today)
+            elif dirty:
+                self._refresh_rooms(today, dirty)
+        except Exception:
+            self.mark_dirty(None)
+            raise
+
+    def _rebuild(self, today: date) -> None:
+        """Tính lại toàn bộ: danh mục phòng (có cache) + một truy vấn booking"""
+        window = self._window(today)
+        rooms = get_all_rooms(self.property_id)
+        bookings_by_room = defaultdict(list)
+        for booking in get_bookings_in_range(ordinal_to_str(window[0]), ordinal_to_str(window[1]), self.property_id):
+            bookings_by_room[booking.room_id].append(booking)
+
+        self.rooms = rooms
+        self.gaps = {}
+        for room in rooms:
+            self._set_room_gaps(room.id, bookings_by_room[room.id], window)
+        self._rebuild_answers(today)
+        self.built_for = today
+        self.metrics["rebuilds"] += 1
+        logger.info(f"Tính sẵn {len(self.answers)} câu trả lời inline ({self.property_id})")
+
+    def _refresh_rooms(self, today: date, room_ids: Set[str]) -> None:
+        """Đọc lại lịch của các phòng có booking thay đổi rồi cập nhật câu trả lời"""
+        window = self._window(today)
+        for room_id in room_ids:
+            availability = get_room_availability(
+                room_id, ordinal_to_str(window[0]), ordinal_to_str(window[1]), self.property_id
+            )
+            self._set_room_gaps(room_id, availability["bookings"], window)
+        self._rebuild_answers(today)
+        self.metrics["room_refreshes"] += len(room_ids)
+
+    def lookup(self, check_in: str, check_out: str) -> Optional[List[Room]]:
+        return self.answers.get((check_in, check_out))
+
+_answer_sets: Dict[str, AnswerSet] = {}
+
+def get_answer_set(property_id: str) -> AnswerSet:
+    answer_set = _answer_sets.get(property_id)
+    if answer_set is None:
+        answer_set = _answer_sets[property_id] = AnswerSet(property_id)
+    return answer_set
+
+def _on_availability_change(property_id: str, room_ids: Optional[FrozenSet[str]]) -> None:
+    answer_set = _answer_sets.get(property_id)
+    if answer_set is not None:
+        answer_set.mark_dirty(room_ids)
+
+on_availability_change(_on_availability_change)
+
+def get_inline_metrics() -> Dict[str, Dict]:
+    """Thống kê câu trả lời inline theo cơ sở"""
+    return {property_id: dict(s.metrics) for property_id, s in _answer_sets.items()}
+
+def parse_inline_query(query: str, today: Optional[date] = None) -> Tuple[str, str, List[str]]:
+    """
+    Phân tích inline query dạng "25/12 27/12 family".
+    Không có ngày: đêm nay; một ngày: ở một đêm. Phần còn lại là từ khóa
+    lọc phòng (tên/loại phòng; số = sức chứa tối thiểu).
+    Trả về (check_in, check_out, keywords).
+    """
+    today = today or date.today()
+    dates: List[date] = []
+    keywords: List[str] = []
+    for token in query.lower().split():
+        if _DATE_TOKEN.fullmatch(token):
+            dates.append(to_date(token, today))
+        elif not _PARTIAL_DATE_TOKEN.fullmatch(token):
+            keywords.append(token)
+    if len(dates) > 2:
+        raise ValueError("Chỉ nhập ngày nhận và ngày trả phòng")
+
+    check_in = dates[0] if dates else today
+    check_out = dates[1] if len(dates) == 2 else check_in + timedelta(days=1)
+    if check_in < today:
+        raise ValueError("Ngày nhận phòng đã qua")
+    if check_out <= check_in:
+        raise ValueError("Ngày trả phòng phải sau ngày nhận phòng")
+    return check_in.strftime("%Y-%m-%d"), check_out.strftime("%Y-%m-%d"), keywords
+
+def filter_rooms(rooms: List[Room], keywords: List[str]) -> List[Room]:
+    """Lọc phòng theo từ khóa: chữ khớp tên/loại phòng, số là sức chứa tối thiểu"""
+    def matches(room: Room) -> bool:
+        text = f"{room.name} {room.type}".lower()
+        for keyword in keywords:
+            if keyword.isdigit():
+                if (room.capacity or 0) < int(keyword):
+                    return False
+            elif keyword not in text:
+                return False
+        return True
+
+    return [room for room in rooms if matches(room)]
+
+def search_rooms(check_in: str, check_out: str, property_id: str) -> List[Room]:
+    """
+    Phòng trống cho inline query. Khoảng ngày phổ biến được trả từ bộ nhớ;
+    khoảng khác dùng get_all_available_rooms (có cache riêng).
+    Nếu không cập nhật được (Firestore lỗi) thì dùng câu trả lời đang có.
+    """
+    answer_set = get_answer_set(property_id)
+    try:
+        answer_set.refresh()
+    except Exception as e:
+        logger.error(f"Lỗi khi cập nhật câu trả lời inline: {str(e)}")
+        if answer_set.built_for is not None:
+            mark_degraded("firestore")
+
+    rooms = answer_set.lookup(check_in, check_out)
+    if rooms is not None:
+        answer_set.metrics["hits"] += 1
+        return rooms
+    answer_set.metrics["misses"] += 1
+    return get_all_available_rooms(check_in, check_out, property_id)
@@ -0,0 +1,46 @@
+from bisect import bisect_right
+from datetime import date, datetime
+from typing import List, Optional, Tuple
+
+# Lịch phòng biểu diễn bằng các khoảng ngày đóng theo ordinal (date.toordinal()),
+# dùng chung cho tìm phương án thay thế và câu trả lời inline tính sẵn
+
+Interval = Tuple[int, int]
+
+def to_ordinal(date_str: str) -> int:
+    return datetime.strptime(date_str, "%Y-%m-%d").date().toordinal()
+
+def ordinal_to_str(ordinal: int) -> str:
+    return date.fromordinal(ordinal).strftime("%Y-%m-%d")
+
+def free_gaps(busy: List[Interval], window_start: int, window_end: int) -> List[Interval]:
+    """
+    Quét các khoảng bận (đóng, theo ordinal) và trả về các khoảng trống
+    trong cửa sổ [window_start, window_end].
+    Quy ước trùng lịch giống các truy vấn Firestore: booking [bi, bo] chặn
+    mọi lượt ở [s, e] với bo >= s và bi <= e, nên cả hai đầu đều tính là bận.
+    """
+    gaps = []
+    cursor = window_start
+    for start, end in sorted(busy):
+        if end < cursor:
+            continue
+        if start > window_end:
+            break
+        if start > cursor:
+            gaps.append((cursor, start - 1))
+        cursor = max(cursor, end + 1)
+    if cursor <= window_end:
+        gaps.append((cursor, window_end))
+    return gaps
+
+def gap_containing(gaps: List[Interval], gap_starts: List[int], day: int) -> Optional[Interval]:
+    """Tìm khoảng trống chứa ngày `day` bằng tìm kiếm nhị phân"""
+    idx = bisect_right(gap_starts, day) - 1
+    if idx >= 0 and gaps[idx][1] >= day:
+        return gaps[idx]
+    return None
+
+def fits(gaps: List[Interval], gap_starts: List[int], start: int, end: int) -> bool:
+    gap = gap_containing(gaps, gap_starts, start)
+    return gap is not None and gap[1] >= end
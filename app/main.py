@@ -1,7 +1,8 @@
 import os
 import logging
 from telegram.ext import Application
-from .telegram_bot import setup_handlers
+from .telegram_bot import CONCURRENT_UPDATES, ChatOrderedApplication, setup_handlers
+from .sweeper import schedule_sweeper
 from .firestore import init_firestore, check_availability
 from .openai_helper import init_openai
 
@@ -11,31 +12,45 @@ logging.basicConfig(
     level=logging.INFO
 )
 
-def seed_rooms_data():
+# Dữ liệu mẫu cho collection 'rooms'
+ROOMS_DATA = [
+    {"id": "101", "name": "Room 101", "type": "Family", "status": "available", "capacity": 4},
+    {"id": "102", "name": "Room 102", "type": "Single", "status": "available", "capacity": 1},
+    {"id": "202", "name": "Room 202", "type": "Single", "status": "available", "capacity": 1},
+    {"id": "103", "name": "Room 103", "type": "Deluxe Double", "status": "available", "capacity": 2},
+    {"id": "203", "name": "Room 203", "type": "Deluxe Double", "status": "available", "capacity": 2},
+    {"id": "301", "name": "Room 301", "type": "Standard Double", "status": "available", "capacity": 2},
+    {"id": "302", "name": "Room 302", "type": "Standard Double", "status": "available", "capacity": 2},
+    {"id": "201", "name": "Room 201", "type": "Deluxe Queen", "status": "available", "capacity": 2}
+]
+
+def seed_rooms_data(property_id=None, name="Hello Dalat Hostel", rooms=None):
     """
-    Khởi tạo dữ liệu mẫu cho collection 'rooms' trong Firestore.
+    Khởi tạo dữ liệu mẫu cho collection 'rooms' của một cơ sở trong Firestore.
     """
-    rooms_data = [
-        {"id": "101", "name": "Room 101", "type": "Family", "status": "available", "capacity": 4},
-        {"id": "102", "name": "Room 102", "type": "Single", "status": "available", "capacity": 1},
-        {"id": "202", "name": "Room 202", "type": "Single", "status": "available", "capacity": 1},
-        {"id": "103", "name": "Room 103", "type": "Deluxe Double", "status": "available", "capacity": 2},
-        {"id": "203", "name": "Room 203", "type": "Deluxe Double", "status": "available", "capacity": 2},
-        {"id": "301", "name": "Room 301", "type": "Standard Double", "status": "available", "capacity": 2},
-        {"id": "302", "name": "Room 302", "type": "Standard Double", "status": "available", "capacity": 2},
-        {"id": "201", "name": "Room 201", "type": "Deluxe Queen", "status": "available", "capacity": 2}
-    ]
-    from app.firestore import init_firestore
+    from app.firestore import init_firestore, upsert_property, DEFAULT_PROPERTY_ID
     init_firestore()
-    from app.firestore import db
-    for room in rooms_data:
-        db.collection("rooms").document(room["id"]).set({
-            "name": room["name"],
-            "type": room["type"],
-            "status": room["status"],
-            "capacity": room["capacity"]
-        })
-    print("Đã khởi tạo dữ liệu mẫu cho rooms!")
+    upsert_property(property_id or DEFAULT_PROPERTY_ID, name, rooms or ROOMS_DATA)
+    print(f"Đã khởi tạo dữ liệu mẫu cho rooms của {property_id or DEFAULT_PROPERTY_ID}!")
+
+def build_application(token=None, bot=None):
+    """
+    Tạo Telegram Application với cấu hình của bot chạy thật (handlers, sweeper).
+    Update của các chat khác nhau được xử lý đồng thời (để ParseBatcher gộp
+    được tin nhắn), trong cùng một chat vẫn tuần tự.
+    Load test dùng chung hàm này (truyền bot giả) để đo đúng cấu hình production.
+    """
+    builder = Application.builder().application_class(ChatOrderedApplication)
+    builder = builder.concurrent_updates(CONCURRENT_UPDATES)
+    builder = builder.bot(bot) if bot is not None else builder.token(token)
+    app = builder.build()
+
+    # Thiết lập handlers
+    setup_handlers(app)
+
+    # Dọn booking pending quá hạn và đồng bộ trạng thái phòng định kỳ
+    schedule_sweeper(app)
+    return app
 
 def main():
     try:
@@ -50,10 +65,7 @@ def main():
             return
 
         # Tạo Telegram Application
-        app = Application.builder().token(telegram_token).build()
-        
-        # Thiết lập handlers
-        setup_handlers(app)
+        app = build_application(telegram_token)
 
         # Khởi chạy bot
         logging.info("Bot đang khởi động...")
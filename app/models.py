@@ -0,0 +1,88 @@
+from typing import Dict, Tuple
+
+# Các record gọn (dùng __slots__) thay cho dict đầy đủ của document Firestore.
+# Mỗi record khai báo ánh xạ field Firestore -> thuộc tính để các truy vấn
+# dùng select() chỉ lấy đúng những field cần thiết.
+
+class Room:
+    """Thông tin phòng"""
+    __slots__ = ("id", "name", "type", "status", "capacity")
+
+    # Field Firestore -> thuộc tính
+    FIELD_MAP = {
+        "name": "name",
+        "type": "type",
+        "status": "status",
+        "capacity": "capacity",
+    }
+    # Projection cho danh sách phòng hiển thị cho khách
+    LISTING_FIELDS: Tuple[str, ...] = ("name", "type", "capacity")
+
+    def __init__(self, id: str, name: str = "", type: str = "",
+                 status: str = "", capacity: int = 0):
+        self.id = id
+        self.name = name or id
+        self.type = type
+        self.status = status
+        self.capacity = capacity
+
+    @classmethod
+    def from_snapshot(cls, doc) -> "Room":
+        data = doc.to_dict() or {}
+        return cls(doc.id, **{attr: data[field] for field, attr in cls.FIELD_MAP.items() if field in data})
+
+    def to_dict(self) -> Dict:
+        """Chuyển về dict theo tên field Firestore"""
+        return {field: getattr(self, attr) for field, attr in self.FIELD_MAP.items()}
+
+    def __repr__(self) -> str:
+        return f"Room(id={self.id!r}, type={self.type!r}, status={self.status!r})"
+
+class Booking:
+    """Thông tin booking"""
+    __slots__ = ("id", "room_id", "guest_name", "phone", "check_in", "check_out",
+                 "price", "deposit", "status", "notes")
+
+    # Field Firestore -> thuộc tính
+    FIELD_MAP = {
+        "roomId": "room_id",
+        "guestName": "guest_name",
+        "phone": "phone",
+        "checkIn": "check_in",
+        "checkOut": "check_out",
+        "price": "price",
+        "deposit": "deposit",
+        "status": "status",
+        "notes": "notes",
+    }
+    # Projection cho các truy vấn kiểm tra trùng lịch
+    SCHEDULE_FIELDS: Tuple[str, ...] = ("roomId", "checkIn", "checkOut", "status")
+    # Projection cho danh sách check-in
+    CHECKIN_FIELDS: Tuple[str, ...] = ("roomId", "guestName", "phone", "checkIn", "status")
+
+    def __init__(self, id: str, room_id: str = "", guest_name: str = "", phone: str = "",
+                 check_in: str = "", check_out: str = "", price: int = 0, deposit: int = 0,
+                 status: str = "", notes: str = ""):
+        self.id = id
+        self.room_id = room_id
+        self.guest_name = guest_name
+        self.phone = phone
+        self.check_in = check_in
+        self.check_out = check_out
+        self.price = price
+        self.deposit = deposit
+        self.status = status
+        self.notes = notes
+
+    @classmethod
+    def from_snapshot(cls, doc) -> "Booking":
+        data = doc.to_dict() or {}
+        return cls(doc.id, **{attr: data[field] for field, attr in cls.FIELD_MAP.items() if field in data})
+
+    def to_dict(self) -> Dict:
+        """Chuyển về dict theo tên field Firestore"""
+        return {field: getattr(self, attr) for field, attr in self.FIELD_MAP.items()}
+
+    def __repr__(self) -> str:
+        return (f"Booking(id={self.id!r}, room_id={self.room_id!r}, "
+                f"{self.check_in}->{self.check_out}, status={self.status!r})")
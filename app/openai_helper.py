@@ -1,9 +1,14 @@
 import openai
+import asyncio
 import json
 import os
+import re
+import time
 import logging
-from typing import Dict
-from datetime import datetime
+from typing import Dict, List, Optional, Tuple, Union
+from datetime import date, datetime
+from app.parsing import to_date, to_vnd
+from app.resilience import CircuitOpenError, begin_update, guarded_async, openai_breaker, remaining_timeout
 
 def init_openai():
     api_key = os.getenv("OPENAI_API_KEY")
@@ -12,48 +17,406 @@ def init_openai():
         return
     openai.api_key = api_key
 
-async def parse_booking_text(text: str) -> Dict:
+# Định dạng JSON và ví dụ mẫu của prompt cũ (phiên bản "legacy"), giữ lại để so sánh
+BOOKING_FORMAT = """
+        {
+            "guest_name": "Tên khách (viết hoa chữ cái đầu)",
+            "phone": "Số điện thoại",
+            "room_id": "Mã phòng",
+            "check_in": "YYYY-MM-DD",
+            "check_out": "YYYY-MM-DD",
+            "price": "Giá phòng (số nguyên)",
+            "deposit": "Tiền cọc (số nguyên)"
+        }
+
+        Ví dụ:
+        "Đặt phòng room_101 cho Nguyễn Văn A từ 25/12 đến 27/12 giá 1.500.000, cọc 500k"
+        → {
+            "guest_name": "Nguyễn Văn A",
+            "phone": "0912345678",
+            "room_id": "room_101",
+            "check_in": "2024-12-25",
+            "check_out": "2024-12-27",
+            "price": 1500000,
+            "deposit": 500000
+        }
+"""
+
+BOOKING_FIELDS = ["guest_name", "phone", "room_id", "check_in", "check_out", "price", "deposit"]
+
+# JSON schema cho function calling (phiên bản "structured")
+BOOKING_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "guest_name": {"type": "string", "description": "Tên khách, viết hoa chữ cái đầu"},
+        "phone": {"type": ["string", "null"]},
+        "room_id": {"type": "string"},
+        "check_in": {"type": "string", "description": "YYYY-MM-DD"},
+        "check_out": {"type": "string", "description": "YYYY-MM-DD"},
+        "price": {"type": ["integer", "null"], "description": "VND"},
+        "deposit": {"type": ["integer", "null"], "description": "VND"},
+    },
+    "required": BOOKING_FIELDS,
+}
+BOOKING_FUNCTION = {
+    "name": "save_booking",
+    "description": "Lưu thông tin đặt phòng",
+    "parameters": BOOKING_SCHEMA,
+}
+BOOKING_BATCH_FUNCTION = {
+    "name": "save_bookings",
+    "description": "Lưu thông tin đặt phòng của từng tin nhắn",
+    "parameters": {
+        "type": "object",
+        "properties": {
+            "results": {
+                "type": "array",
+                "items": {
+                    "type": "object",
+                    "properties": dict(BOOKING_SCHEMA["properties"], index={"type": "integer"}),
+                    "required": ["index"] + BOOKING_FIELDS,
+                },
+            }
+        },
+        "required": ["results"],
+    },
+}
+
+PROMPT_VERSIONS = ("legacy", "structured")
+# Phiên bản prompt dùng khi chạy bot
+BOOKING_PROMPT_VERSION = os.getenv("BOOKING_PROMPT_VERSION", "structured")
+MODEL = "gpt-3.5-turbo"
+
+# Cấu hình gộp request (chỉ khi đang có request chạy): chờ tối đa PARSE_BATCH_WINDOW_MS hoặc đủ PARSE_BATCH_MAX_SIZE tin nhắn
+PARSE_BATCH_WINDOW = int(os.getenv("PARSE_BATCH_WINDOW_MS", "100")) / 1000
+PARSE_BATCH_MAX_SIZE = int(os.getenv("PARSE_BATCH_MAX_SIZE", "8"))
+
+# Thống kê token và độ trễ theo phiên bản prompt
+llm_call_stats: Dict[str, Dict] = {}
+
+# Timeout mặc định cho mỗi request ChatGPT (giây), bị rút ngắn theo deadline của update
+OPENAI_TIMEOUT = float(os.getenv("OPENAI_TIMEOUT_SECONDS", "15"))
+
+async def _chat_completion(**kwargs):
+    """Gọi ChatCompletion qua circuit breaker, với timeout theo deadline của update"""
+    return await guarded_async(
+        openai_breaker,
+        lambda timeout: openai.ChatCompletion.acreate(request_timeout=timeout, **kwargs),
+        OPENAI_TIMEOUT
+    )
+
+def _estimate_tokens(text: str) -> int:
+    """Ước lượng số token (~4 ký tự/token) khi không có usage thực tế"""
+    return max(1, len(text) // 4)
+
+def _record_llm_call(version: str, response, latency: float, items: int = 1) -> None:
+    stats = llm_call_stats.setdefault(version, {
+        "calls": 0, "items": 0, "prompt_tokens": 0, "completion_tokens": 0, "latency": 0.0
+    })
+    usage = getattr(response, "usage", None)
+    stats["calls"] += 1
+    stats["items"] += items
+    stats["prompt_tokens"] += getattr(usage, "prompt_tokens", 0) if usage else 0
+    stats["completion_tokens"] += getattr(usage, "completion_tokens", 0) if usage else 0
+    stats["latency"] += latency
+    logging.debug(
+        f"LLM [{version}] {items} tin nhắn, "
+        f"{getattr(usage, 'prompt_tokens', '?')}+{getattr(usage, 'completion_tokens', '?')} token, "
+        f"{latency * 1000:.0f} ms"
+    )
+
+def _system_prompt(today: date) -> str:
+    """Prompt tối giản cho chế độ structured, kèm ngày hôm nay để hiểu ngày tương đối"""
+    return (
+        "Trích xuất thông tin đặt phòng khách sạn từ tin nhắn tiếng Việt. "
+        f"Hôm nay là {today.isoformat()}; ngày thiếu năm (vd 25/12) là ngày gần nhất kể từ hôm nay. "
+        "Tiền tính bằng VND (500k = 500000, 1tr5 = 1500000). "
+        "Thông tin không có trong tin nhắn thì để null, không tự đoán; chỉ ghi 0 khi tin nhắn nói rõ (vd không cọc)."
+    )
+
+def validate_booking(data: Dict, today: Optional[date] = None) -> Dict:
     """
-    Phân tích tin nhắn đặt phòng bằng ChatGPT, trả về dict thông tin booking.
+    Kiểm tra kết quả trích xuất theo BOOKING_SCHEMA và chuẩn hóa kiểu dữ liệu.
+    Mọi field đều bắt buộc: thiếu hoặc null là lỗi, giá/cọc bằng 0 phải được ghi rõ.
+    Raise ValueError nếu thiếu thông tin, ngày nhận phòng đã qua hoặc không chuẩn hóa được.
     """
+    today = today or date.today()
+    if not isinstance(data, dict):
+        raise ValueError("Kết quả phân tích không phải object")
+    for field in BOOKING_FIELDS:
+        if data.get(field) is None or str(data[field]).strip() == "":
+            raise ValueError(f"Thiếu thông tin bắt buộc: {field}")
+
+    check_in = to_date(data["check_in"], today)
+    check_out = to_date(data["check_out"], today)
+    if check_out <= check_in and re.fullmatch(r"\d{1,2}/\d{1,2}", str(data["check_out"]).strip()):
+        # "28/12 đến 02/01": ngày đi sang năm sau
+        check_out = check_out.replace(year=check_out.year + 1)
+    if check_in < today:
+        raise ValueError("Ngày nhận phòng đã qua")
+    if check_out <= check_in:
+        raise ValueError("Ngày trả phòng phải sau ngày nhận phòng")
+
+    price = to_vnd(data["price"])
+    deposit = to_vnd(data["deposit"])
+    if price < 0 or deposit < 0:
+        raise ValueError(f"Số tiền không hợp lệ: {data['price']}, {data['deposit']}")
+
+    return {
+        "guest_name": str(data["guest_name"]).strip(),
+        "phone": str(data["phone"]).strip(),
+        "room_id": str(data["room_id"]).strip(),
+        "check_in": check_in.isoformat(),
+        "check_out": check_out.isoformat(),
+        "price": price,
+        "deposit": deposit,
+    }
+
+def _function_arguments(response) -> Dict:
+    """Lấy arguments của function_call; raise ValueError nếu không phải JSON"""
+    message = response.choices[0].message
+    function_call = message.get("function_call") if hasattr(message, "get") else getattr(message, "function_call", None)
+    if not function_call:
+        raise ValueError("OpenAI không trả về function_call")
+    arguments = function_call["arguments"] if isinstance(function_call, dict) else function_call.arguments
     try:
+        return json.loads(arguments)
+    except Exception:
+        logging.error(f"OpenAI trả về arguments không phải JSON: {arguments}")
+        raise ValueError("Phân tích tin nhắn thất bại, định dạng không hợp lệ.")
+
+async def _parse_single(text: str, version: Optional[str] = None, today: Optional[date] = None) -> Dict:
+    """Gọi ChatGPT cho một tin nhắn duy nhất"""
+    version = version or BOOKING_PROMPT_VERSION
+    today = today or date.today()
+    started = time.perf_counter()
+    if version == "legacy":
         prompt = f"""
         Phân tích tin nhắn đặt phòng sau thành JSON:
-        {{
-            \"guest_name\": \"Tên khách (viết hoa chữ cái đầu)\",
-            \"phone\": \"Số điện thoại\",
-            \"room_id\": \"Mã phòng\",
-            \"check_in\": \"YYYY-MM-DD\",
-            \"check_out\": \"YYYY-MM-DD\",
-            \"price\": \"Giá phòng (số nguyên)\",
-            \"deposit\": \"Tiền cọc (số nguyên)\"
-        }}
-
-        Ví dụ:
-        \"Đặt phòng room_101 cho Nguyễn Văn A từ 25/12 đến 27/12 giá 1.500.000, cọc 500k\"
-        → {{
-            \"guest_name\": \"Nguyễn Văn A\",
-            \"phone\": \"0912345678\",
-            \"room_id\": \"room_101\",
-            \"check_in\": \"2024-12-25\",
-            \"check_out\": \"2024-12-27\",
-            \"price\": 1500000,
-            \"deposit\": 500000
-        }}
-
-        Tin nhắn: \"{text}\"
+        {BOOKING_FORMAT}
+        Tin nhắn: "{text}"
         """
-        response = openai.ChatCompletion.create(
-            model="gpt-3.5-turbo",
+        response = await _chat_completion(
+            model=MODEL,
             messages=[{"role": "user", "content": prompt}],
             temperature=0.3
         )
+        _record_llm_call(version, response, time.perf_counter() - started)
         content = response.choices[0].message.content
         try:
-            return json.loads(content)
+            data = json.loads(content)
         except Exception:
             logging.error(f"OpenAI trả về không phải JSON: {content}")
             raise ValueError("Phân tích tin nhắn thất bại, định dạng không hợp lệ.")
+        # Prompt cũ trả tiền dạng chuỗi ("1.500.000"): chuẩn hóa giống phiên bản structured
+        return validate_booking(data, today)
+
+    response = await _chat_completion(
+        model=MODEL,
+        messages=[
+            {"role": "system", "content": _system_prompt(today)},
+            {"role": "user", "content": text},
+        ],
+        functions=[BOOKING_FUNCTION],
+        function_call={"name": BOOKING_FUNCTION["name"]},
+        temperature=0
+    )
+    _record_llm_call(version, response, time.perf_counter() - started)
+    return validate_booking(_function_arguments(response), today)
+
+class ParseBatcher:
+    """
+    Gom các yêu cầu phân tích tin nhắn thành một request ChatGPT duy nhất,
+    rồi trả kết quả về cho từng handler. Khi không có request nào đang chạy,
+    tin nhắn được gửi ngay (không chờ); chỉ tin nhắn đến trong lúc đang chờ
+    ChatGPT mới được gom lại, gửi khi request trước xong, hết cửa sổ thời
+    gian hoặc đủ max_size. Tin nhắn bị thiếu hoặc không đọc được trong kết
+    quả gộp sẽ được phân tích lại riêng lẻ; tin nhắn thiếu thông tin thì trả
+    lỗi luôn (gọi lại ChatGPT cũng không có thêm thông tin).
+    Chỉ có tác dụng khi bot xử lý nhiều update đồng thời (xem build_application).
+    """
+
+    def __init__(self, window: float = PARSE_BATCH_WINDOW, max_size: int = PARSE_BATCH_MAX_SIZE):
+        self.window = window
+        self.max_size = max_size
+        self._pending: List[Tuple[str, asyncio.Future]] = []
+        self._timer: Optional[asyncio.TimerHandle] = None
+        # Số batch đang chờ ChatGPT
+        self._running = 0
+        self.metrics = {
+            "batches": 0,
+            "items": 0,
+            "max_batch_size": 0,
+            "fallbacks": 0,
+            "prompt_tokens": 0,
+            "tokens_saved": 0,
+        }
+
+    async def submit(self, text: str) -> Dict:
+        """Đưa tin nhắn vào hàng đợi và chờ kết quả phân tích"""
+        if self.window <= 0 or self.max_size <= 1:
+            return await _parse_single(text)
+
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._pending.append((text, future))
+        if len(self._pending) >= self.max_size or self._running == 0:
+            self._flush()
+        elif self._timer is None:
+            self._timer = loop.call_later(self.window, self._flush)
+        # Mỗi handler chỉ chờ tới deadline của chính nó; batch vẫn chạy tiếp cho các handler khác
+        return await asyncio.wait_for(asyncio.shield(future), timeout=remaining_timeout())
+
+    def _flush(self) -> None:
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        items, self._pending = self._pending, []
+        if items:
+            self._running += 1
+            asyncio.ensure_future(self._run_batch(items))
+
+    async def _run_batch(self, items: List[Tuple[str, asyncio.Future]]) -> None:
+        try:
+            await self._process_batch(items)
+        finally:
+            self._running -= 1
+            # Tin nhắn đến trong lúc chờ ChatGPT được gửi ngay khi request trước xong
+            if self._pending:
+                self._flush()
+
+    async def _process_batch(self, items: List[Tuple[str, asyncio.Future]]) -> None:
+        # Batch phục vụ nhiều update nên không dùng deadline của update nào
+        begin_update(None)
+        self.metrics["batches"] += 1
+        self.metrics["items"] += len(items)
+        self.metrics["max_batch_size"] = max(self.metrics["max_batch_size"], len(items))
+
+        results: List[Optional[Union[Dict, Exception]]] = [None] * len(items)
+        if len(items) > 1:
+            try:
+                results = await self._parse_batch([text for text, _ in items])
+            except Exception as e:
+                logging.error(f"Lỗi phân tích gộp {len(items)} tin nhắn: {str(e)}")
+
+        fallbacks = [i for i, result in enumerate(results) if result is None]
+        self.metrics["fallbacks"] += len(fallbacks) if len(items) > 1 else 0
+        if fallbacks:
+            outcomes = await asyncio.gather(
+                *[_parse_single(items[i][0]) for i in fallbacks], return_exceptions=True
+            )
+            for i, outcome in zip(fallbacks, outcomes):
+                results[i] = outcome
+
+        for (_, future), result in zip(items, results):
+            if future.done():
+                continue
+            if isinstance(result, Exception):
+                future.set_exception(result)
+            else:
+                future.set_result(result)
+
+    async def _parse_batch(self, texts: List[str]) -> List[Optional[Union[Dict, ValueError]]]:
+        """
+        Gửi nhiều tin nhắn trong một request. Trả về danh sách kết quả theo
+        thứ tự đầu vào; phần tử None nghĩa là ChatGPT bỏ sót/trả sai định dạng,
+        cần phân tích lại riêng lẻ; ValueError nghĩa là tin nhắn thiếu thông tin.
+        """
+        version = BOOKING_PROMPT_VERSION
+        today = date.today()
+        messages_block = "\n".join(f'{i}. "{text}"' for i, text in enumerate(texts))
+        started = time.perf_counter()
+        if version == "legacy":
+            prompt = f"""
+        Phân tích từng tin nhắn đặt phòng dưới đây thành JSON theo định dạng:
+        {BOOKING_FORMAT}
+        Trả về DUY NHẤT một JSON dạng {{"results": [{{"index": 0, ...}}, ...]}},
+        mỗi phần tử ứng với một tin nhắn, giữ nguyên "index".
+
+        Tin nhắn:
+        {messages_block}
+        """
+            single_overhead = _estimate_tokens(BOOKING_FORMAT)
+            response = await _chat_completion(
+                model=MODEL,
+                messages=[{"role": "user", "content": prompt}],
+                temperature=0.3
+            )
+        else:
+            prompt = _system_prompt(today) + "\n" + messages_block
+            single_overhead = _estimate_tokens(_system_prompt(today) + json.dumps(BOOKING_FUNCTION))
+            response = await _chat_completion(
+                model=MODEL,
+                messages=[
+                    {"role": "system", "content": _system_prompt(today)},
+                    {"role": "user", "content": messages_block},
+                ],
+                functions=[BOOKING_BATCH_FUNCTION],
+                function_call={"name": BOOKING_BATCH_FUNCTION["name"]},
+                temperature=0
+            )
+        _record_llm_call(version, response, time.perf_counter() - started, len(texts))
+
+        usage = getattr(response, "usage", None)
+        batch_tokens = usage.prompt_tokens if usage else _estimate_tokens(prompt)
+        self.metrics["prompt_tokens"] += batch_tokens
+        self.metrics["tokens_saved"] += max(
+            0, single_overhead * len(texts) + sum(_estimate_tokens(t) for t in texts) - batch_tokens
+        )
+
+        try:
+            if version == "legacy":
+                parsed = json.loads(response.choices[0].message.content)
+            else:
+                parsed = _function_arguments(response)
+            items = parsed["results"] if isinstance(parsed, dict) else parsed
+        except Exception:
+            logging.error(f"OpenAI trả về kết quả gộp không hợp lệ: {response.choices[0].message}")
+            return [None] * len(texts)
+
+        results: List[Optional[Union[Dict, ValueError]]] = [None] * len(texts)
+        for position, item in enumerate(items if isinstance(items, list) else []):
+            if not isinstance(item, dict):
+                continue
+            index = item.pop("index", position)
+            if not isinstance(index, int) or not 0 <= index < len(texts):
+                continue
+            try:
+                results[index] = validate_booking(item, today)
+            except ValueError as e:
+                # Kết quả đúng định dạng nhưng tin nhắn thiếu thông tin: không phân tích lại
+                logging.warning(f"Kết quả gộp của tin nhắn {index} không hợp lệ: {str(e)}")
+                results[index] = e
+        logging.info(
+            f"Phân tích gộp {len(texts)} tin nhắn, "
+            f"{sum(r is None for r in results)} tin nhắn cần phân tích lại"
+        )
+        return results
+
+# Batcher dùng chung cho toàn bộ bot
+parse_batcher = ParseBatcher()
+
+def get_parse_metrics() -> Dict:
+    """Thống kê kích thước batch, số token tiết kiệm được và chi phí theo phiên bản prompt"""
+    metrics = dict(parse_batcher.metrics)
+    metrics["avg_batch_size"] = metrics["items"] / metrics["batches"] if metrics["batches"] else 0
+    metrics["prompt_versions"] = {version: dict(stats) for version, stats in llm_call_stats.items()}
+    return metrics
+
+class ParserUnavailableError(Exception):
+    """ChatGPT tạm thời không dùng được: breaker mở hoặc quá thời gian chờ"""
+
+async def parse_booking_text(text: str) -> Dict:
+    """
+    Phân tích tin nhắn đặt phòng bằng ChatGPT, trả về dict thông tin booking.
+    Các tin nhắn đến gần nhau được gộp vào một request (xem ParseBatcher).
+    Raise ParserUnavailableError khi ChatGPT quá tải/không phản hồi kịp.
+    """
+    try:
+        return await parse_batcher.submit(text)
+    except (CircuitOpenError, TimeoutError, asyncio.TimeoutError) as e:
+        logging.warning(f"ChatGPT không phản hồi kịp: {str(e) or type(e).__name__}")
+        raise ParserUnavailableError(str(e)) from e
     except Exception as e:
         logging.error(f"Lỗi phân tích tin nhắn: {str(e)}")
         raise
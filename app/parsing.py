@@ -0,0 +1,43 @@
+import re
+from datetime import date, datetime
+
+# Chuẩn hóa số tiền và ngày do người dùng/ChatGPT nhập, dùng chung cho
+# phân tích tin nhắn, cập nhật booking và inline query
+
+def to_vnd(value) -> int:
+    """Chuẩn hóa số tiền về số nguyên VND: 1500000, "1.500.000", "500k", "1tr5", "1,5 triệu" """
+    if isinstance(value, bool):
+        raise ValueError(f"Số tiền không hợp lệ: {value}")
+    if isinstance(value, int):
+        return value
+    if isinstance(value, float):
+        return int(round(value))
+    if value is None or str(value).strip() == "":
+        raise ValueError("Thiếu số tiền")
+    # "đồng" phải bỏ trước "đ", nếu không sẽ còn sót "ồng"
+    text = str(value).lower().replace(" ", "").replace("vnd", "").replace("đồng", "").replace("đ", "")
+    if re.fullmatch(r"\d{1,3}([.,]\d{3})+|\d+", text):
+        return int(re.sub(r"[.,]", "", text))
+    match = re.fullmatch(r"(\d+(?:[.,]\d+)?)(k|nghìn|ngàn|tr|triệu)(\d*)", text)
+    if not match:
+        raise ValueError(f"Số tiền không hợp lệ: {value}")
+    amount = float(match.group(1).replace(",", "."))
+    if match.group(3):
+        amount += float("0." + match.group(3))
+    unit = 1000 if match.group(2) in ("k", "nghìn", "ngàn") else 1000000
+    return int(round(amount * unit))
+
+def to_date(value, today: date) -> date:
+    """Chuẩn hóa ngày về date: YYYY-MM-DD, dd/mm/yyyy hoặc dd/mm (ngày gần nhất từ hôm nay)"""
+    text = str(value or "").strip()
+    for fmt in ("%Y-%m-%d", "%d/%m/%Y"):
+        try:
+            return datetime.strptime(text, fmt).date()
+        except ValueError:
+            pass
+    match = re.fullmatch(r"(\d{1,2})/(\d{1,2})", text)
+    if not match:
+        raise ValueError(f"Ngày không hợp lệ: {value}")
+    day, month = int(match.group(1)), int(match.group(2))
+    result = date(today.year, month, day)
+    return result if result >= today else date(today.year + 1, month, day)
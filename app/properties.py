@@ -0,0 +1,37 @@
+import logging
+from typing import Dict, List
+
+from app.firestore import (
+    DEFAULT_PROPERTY_ID, get_chat_property_id, get_properties, set_chat_property_id
+)
+
+# Khởi tạo logger
+logger = logging.getLogger(__name__)
+
+# chat_id -> property_id, tránh đọc Firestore ở mỗi update
+_chat_properties: Dict[int, str] = {}
+
+def get_chat_property(chat_id: int) -> str:
+    """
+    Cơ sở mà chat đang làm việc (chưa gắn thì dùng DEFAULT_PROPERTY_ID).
+    Lỗi khi đọc Firestore được raise và không cache, để chat đã gắn với cơ sở
+    khác không bị chuyển nhầm sang cơ sở mặc định.
+    """
+    property_id = _chat_properties.get(chat_id)
+    if property_id is None:
+        property_id = get_chat_property_id(chat_id) or DEFAULT_PROPERTY_ID
+        _chat_properties[chat_id] = property_id
+    return property_id
+
+def bind_chat_property(chat_id: int, property_id: str) -> bool:
+    """Gắn chat với một cơ sở; trả về False nếu cơ sở không tồn tại"""
+    if not any(p["id"] == property_id for p in get_properties()):
+        return False
+    set_chat_property_id(chat_id, property_id)
+    _chat_properties[chat_id] = property_id
+    logger.info(f"Chat {chat_id} chuyển sang cơ sở {property_id}")
+    return True
+
+def list_properties() -> List[Dict]:
+    """Danh sách cơ sở"""
+    return get_properties()
@@ -0,0 +1,308 @@
+import asyncio
+import contextvars
+import functools
+import os
+import threading
+import time
+import logging
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from typing import Callable, Dict, Optional, Set
+
+# Khởi tạo logger
+logger = logging.getLogger(__name__)
+
+# Thời gian tối đa cho một update (giây)
+UPDATE_DEADLINE = float(os.getenv("UPDATE_DEADLINE_SECONDS", "10"))
+
+class CircuitOpenError(Exception):
+    """Circuit breaker đang mở, không gọi dependency"""
+
+    def __init__(self, name: str):
+        super().__init__(f"{name} đang tạm ngưng (circuit breaker mở)")
+        self.name = name
+
+class DeadlineExceeded(TimeoutError):
+    """Hết thời gian xử lý cho update hiện tại"""
+
+# ========== DEADLINE ==========
+_deadline: contextvars.ContextVar[Optional[float]] = contextvars.ContextVar("deadline", default=None)
+# Các dependency đã phải dùng chế độ dự phòng trong update hiện tại
+_degraded: contextvars.ContextVar[Optional[Set[str]]] = contextvars.ContextVar("degraded", default=None)
+
+def begin_update(seconds: Optional[float] = UPDATE_DEADLINE) -> None:
+    """
+    Bắt đầu xử lý một update: đặt deadline cho phần còn lại của task hiện tại
+    (None = không giới hạn) và xóa đánh dấu chế độ dự phòng.
+    """
+    _deadline.set(time.monotonic() + seconds if seconds is not None else None)
+    _degraded.set(set())
+
+def mark_degraded(name: str) -> None:
+    """Đánh dấu update hiện tại đang dùng dữ liệu dự phòng của dependency `name`"""
+    degraded = _degraded.get()
+    if degraded is None:
+        degraded = set()
+        _degraded.set(degraded)
+    degraded.add(name)
+
+def degraded_dependencies() -> Set[str]:
+    """Các dependency đã chạy ở chế độ dự phòng trong update hiện tại"""
+    return set(_degraded.get() or ())
+
+def remaining_timeout(default: Optional[float] = None) -> Optional[float]:
+    """
+    Thời gian còn lại trước deadline (không vượt quá `default`).
+    Raise DeadlineExceeded nếu đã hết hạn.
+    """
+    expires_at = _deadline.get()
+    if expires_at is None:
+        return default
+    remaining = expires_at - time.monotonic()
+    if remaining <= 0:
+        raise DeadlineExceeded("Hết thời gian xử lý yêu cầu")
+    return remaining if default is None else min(default, remaining)
+
+# ========== CIRCUIT BREAKER ==========
+class CircuitBreaker:
+    """
+    Circuit breaker với cửa sổ trượt theo thời gian.
+    Lời gọi lỗi hoặc chậm hơn slow_call_seconds đều tính là thất bại; khi tỉ lệ
+    thất bại trong window_seconds vượt failure_rate (và có ít nhất min_calls
+    lời gọi) thì mở breaker trong open_seconds, sau đó cho một lời gọi thử
+    (half-open) để quyết định đóng lại hay mở tiếp.
+    """
+
+    CLOSED, OPEN, HALF_OPEN = "closed", "open", "half_open"
+
+    def __init__(self, name: str, window_seconds: float = 30, failure_rate: float = 0.5,
+                 min_calls: int = 10, slow_call_seconds: float = 5, open_seconds: float = 15):
+        self.name = name
+        self.window_seconds = window_seconds
+        self.failure_rate = failure_rate
+        self.min_calls = min_calls
+        self.slow_call_seconds = slow_call_seconds
+        self.open_seconds = open_seconds
+        self.state = self.CLOSED
+        self._opened_at = 0.0
+        self._probe_in_flight = False
+        # (thời điểm, thành công, độ trễ)
+        self._calls: deque = deque()
+        self._window_failures = 0
+        self._lock = threading.Lock()
+        # p95 tính lại tối đa mỗi giây một lần (sắp xếp cả cửa sổ khá tốn kém)
+        self._p95 = (None, 0.0)
+        self.metrics = {"calls": 0, "failures": 0, "rejected": 0, "opened": 0}
+
+    def _trim(self, now: float) -> None:
+        while self._calls and self._calls[0][0] < now - self.window_seconds:
+            _, ok, _ = self._calls.popleft()
+            self._window_failures -= not ok
+
+    def allow(self) -> bool:
+        """Cho phép gọi dependency hay không"""
+        with self._lock:
+            if self.state == self.OPEN:
+                if time.monotonic() - self._opened_at < self.open_seconds:
+                    self.metrics["rejected"] += 1
+                    return False
+                self.state = self.HALF_OPEN
+                self._probe_in_flight = False
+                logger.info(f"Circuit breaker {self.name}: half-open")
+            if self.state == self.HALF_OPEN:
+                if self._probe_in_flight:
+                    self.metrics["rejected"] += 1
+                    return False
+                self._probe_in_flight = True
+            return True
+
+    def record(self, success: bool, latency: float) -> None:
+        """Ghi nhận kết quả một lời gọi"""
+        success = success and latency <= self.slow_call_seconds
+        now = time.monotonic()
+        with self._lock:
+            self.metrics["calls"] += 1
+            if not success:
+                self.metrics["failures"] += 1
+            if self.state == self.HALF_OPEN:
+                self._probe_in_flight = False
+                if success:
+                    self.state = self.CLOSED
+                    self._calls.clear()
+                    self._window_failures = 0
+                    logger.info(f"Circuit breaker {self.name}: closed")
+                else:
+                    self._open(now)
+                return
+            self._calls.append((now, success, latency))
+            self._window_failures += not success
+            self._trim(now)
+            if (self.state == self.CLOSED and len(self._calls) >= self.min_calls
+                    and self._window_failures / len(self._calls) >= self.failure_rate):
+                self._open(now)
+
+    def record_inconclusive(self, latency: float) -> None:
+        """
+        Ghi nhận lời gọi bị ngắt vì hết deadline của update: không biết
+        dependency có trả lời được hay không. Khi half-open chỉ giải phóng
+        lượt gọi thử (breaker vẫn half-open), ngược lại chỉ tính độ trễ.
+        """
+        with self._lock:
+            half_open = self.state == self.HALF_OPEN
+            if half_open:
+                self._probe_in_flight = False
+        if not half_open:
+            self.record(True, latency)
+
+    def _open(self, now: float) -> None:
+        self.state = self.OPEN
+        self._opened_at = now
+        self.metrics["opened"] += 1
+        logger.warning(f"Circuit breaker {self.name}: open trong {self.open_seconds}s")
+
+    @property
+    def degraded(self) -> bool:
+        return self.state != self.CLOSED
+
+    def latency_percentile(self, pct: float) -> Optional[float]:
+        with self._lock:
+            latencies = sorted(latency for _, _, latency in self._calls)
+        if not latencies:
+            return None
+        return latencies[min(len(latencies) - 1, int(len(latencies) * pct / 100))]
+
+    def p95_latency(self) -> Optional[float]:
+        value, computed_at = self._p95
+        now = time.monotonic()
+        if value is None or now - computed_at >= 1:
+            value = self.latency_percentile(95)
+            self._p95 = (value, now)
+        return value
+
+    def snapshot(self) -> Dict:
+        with self._lock:
+            now = time.monotonic()
+            self._trim(now)
+            window_calls = len(self._calls)
+            window_failures = self._window_failures
+        p95 = self.latency_percentile(95)
+        return dict(
+            self.metrics,
+            state=self.state,
+            window_calls=window_calls,
+            window_failure_rate=window_failures / window_calls if window_calls else 0.0,
+            p95_ms=round(p95 * 1000, 1) if p95 is not None else None,
+        )
+
+firestore_breaker = CircuitBreaker(
+    "firestore", slow_call_seconds=float(os.getenv("FIRESTORE_SLOW_CALL_SECONDS", "3"))
+)
+openai_breaker = CircuitBreaker(
+    "openai", min_calls=5, slow_call_seconds=float(os.getenv("OPENAI_SLOW_CALL_SECONDS", "20")),
+    open_seconds=30
+)
+
+def get_breaker_metrics() -> Dict[str, Dict]:
+    """Trạng thái và thống kê của các circuit breaker"""
+    return {breaker.name: breaker.snapshot() for breaker in (firestore_breaker, openai_breaker)}
+
+# ========== GUARDED CALLS ==========
+# Thread pool cho các lời gọi đọc có hedging
+_executor = ThreadPoolExecutor(max_workers=int(os.getenv("HEDGE_WORKERS", "16")),
+                               thread_name_prefix="hedge")
+# Giới hạn thời gian chờ trước khi gửi lời gọi dự phòng (giây)
+HEDGE_MIN_DELAY = 0.05
+HEDGE_MAX_DELAY = 1.0
+HEDGE_DEFAULT_DELAY = 0.2
+# Dependency đang nhanh hơn ngưỡng này thì gọi trực tiếp, không qua thread pool
+HEDGE_INLINE_BELOW = 0.01
+
+def _is_dependency_error(error: Exception) -> bool:
+    # Lỗi dữ liệu (ValueError) là lỗi nghiệp vụ, không phải dependency hỏng
+    return not isinstance(error, ValueError)
+
+def _budget_exhausted(error: Exception) -> bool:
+    """
+    Timeout do deadline của update hết (vd đã tiêu gần hết cho OpenAI), không
+    phải do dependency hỏng. Gồm DeadlineExceeded của module này và của
+    google.api_core (timeout truyền xuống client đã bị rút ngắn theo deadline).
+    """
+    timeout_like = isinstance(error, (TimeoutError, asyncio.TimeoutError)) \
+        or type(error).__name__ == "DeadlineExceeded"
+    expires_at = _deadline.get()
+    return timeout_like and expires_at is not None and time.monotonic() >= expires_at
+
+def _record_outcome(breaker: CircuitBreaker, error: Exception, latency: float) -> None:
+    if _budget_exhausted(error):
+        breaker.record_inconclusive(latency)
+    else:
+        breaker.record(not _is_dependency_error(error), latency)
+
+def _hedged(breaker: CircuitBreaker, func: Callable, args, kwargs):
+    """
+    Gọi func trong thread pool; nếu sau khoảng p95 hiện tại vẫn chưa xong thì
+    gửi thêm một lời gọi giống hệt và lấy kết quả về trước. Chỉ dùng cho
+    thao tác đọc (idempotent). Tôn trọng deadline của update.
+    """
+    hedge_delay = breaker.p95_latency() or HEDGE_DEFAULT_DELAY
+    hedge_delay = min(max(hedge_delay, HEDGE_MIN_DELAY), HEDGE_MAX_DELAY)
+    timeout = remaining_timeout()
+
+    def submit():
+        return _executor.submit(contextvars.copy_context().run, func, *args, **kwargs)
+
+    futures = {submit()}
+    done, _ = wait(futures, timeout=hedge_delay if timeout is None else min(hedge_delay, timeout))
+    if not done:
+        futures.add(submit())
+    error = None
+    while futures:
+        done, futures = wait(futures, timeout=remaining_timeout(), return_when=FIRST_COMPLETED)
+        if not done:
+            raise DeadlineExceeded(f"{breaker.name}: hết thời gian chờ")
+        for future in done:
+            if future.exception() is None:
+                return future.result()
+            error = future.exception()
+    raise error
+
+def guarded(breaker: CircuitBreaker, hedge: bool = False):
+    """
+    Decorator cho lời gọi đồng bộ tới dependency: kiểm tra breaker và deadline,
+    ghi nhận kết quả; hedge=True để gửi lời gọi dự phòng khi chậm (chỉ cho đọc).
+    """
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            # Hết deadline trước khi gọi: không gọi dependency và không ghi nhận vào breaker
+            remaining_timeout()
+            if not breaker.allow():
+                raise CircuitOpenError(breaker.name)
+            started = time.monotonic()
+            try:
+                p95 = breaker.p95_latency()
+                if hedge and (p95 is None or p95 >= HEDGE_INLINE_BELOW):
+                    result = _hedged(breaker, func, args, kwargs)
+                else:
+                    result = func(*args, **kwargs)
+            except Exception as e:
+                _record_outcome(breaker, e, time.monotonic() - started)
+                raise
+            breaker.record(True, time.monotonic() - started)
+            return result
+        return wrapper
+    return decorator
+
+async def guarded_async(breaker: CircuitBreaker, make_call: Callable, timeout: Optional[float] = None):
+    """Phiên bản async của guarded: make_call(timeout) trả về coroutine"""
+    call_timeout = remaining_timeout(timeout)
+    if not breaker.allow():
+        raise CircuitOpenError(breaker.name)
+    started = time.monotonic()
+    try:
+        result = await asyncio.wait_for(make_call(call_timeout), timeout=call_timeout)
+    except Exception as e:
+        _record_outcome(breaker, e, time.monotonic() - started)
+        raise
+    breaker.record(True, time.monotonic() - started)
+    return result
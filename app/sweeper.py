@@ -0,0 +1,66 @@
+import asyncio
+import os
+import time
+import logging
+from typing import Dict
+
+from telegram.ext import Application, ContextTypes
+
+from app.firestore import expire_stale_pending_bookings, get_properties, reconcile_room_statuses
+
+# Khởi tạo logger
+logger = logging.getLogger(__name__)
+
+# Booking pending quá thời gian này (phút) sẽ bị hết hạn
+PENDING_BOOKING_TTL = int(os.getenv("PENDING_BOOKING_TTL_MINUTES", "30")) * 60
+# Chu kỳ chạy sweeper (giây)
+SWEEP_INTERVAL = int(os.getenv("SWEEP_INTERVAL_SECONDS", "600"))
+
+sweeper_metrics = {
+    "runs": 0,
+    "failures": 0,
+    "expired_bookings": 0,
+    "rooms_reconciled": 0,
+    "last_duration": 0.0,
+    "total_duration": 0.0,
+}
+
+def run_sweep() -> Dict:
+    """Chạy một lượt dọn dẹp cho mọi cơ sở, trả về số dòng đã xử lý và thời gian chạy"""
+    started = time.perf_counter()
+    expired = reconciled = 0
+    try:
+        for prop in get_properties():
+            expired += expire_stale_pending_bookings(PENDING_BOOKING_TTL, property_id=prop["id"])
+            reconciled += reconcile_room_statuses(prop["id"])
+    except Exception:
+        sweeper_metrics["failures"] += 1
+        raise
+    finally:
+        duration = time.perf_counter() - started
+        sweeper_metrics["runs"] += 1
+        sweeper_metrics["last_duration"] = duration
+        sweeper_metrics["total_duration"] += duration
+
+    sweeper_metrics["expired_bookings"] += expired
+    sweeper_metrics["rooms_reconciled"] += reconciled
+    logger.info(
+        f"Sweeper: hết hạn {expired} booking, đồng bộ {reconciled} phòng trong {duration * 1000:.0f} ms"
+    )
+    return {"expired": expired, "reconciled": reconciled, "duration": duration}
+
+async def sweep_job(context: ContextTypes.DEFAULT_TYPE) -> None:
+    """Job định kỳ trên JobQueue; chạy trong thread để không chặn event loop"""
+    try:
+        await asyncio.to_thread(run_sweep)
+    except Exception as e:
+        logger.error(f"Lỗi khi chạy sweeper: {str(e)}")
+
+def schedule_sweeper(app: Application) -> None:
+    """Đăng ký sweeper vào JobQueue của bot"""
+    if app.job_queue is None:
+        logger.warning(
+            "JobQueue chưa được cài (python-telegram-bot[job-queue]), bỏ qua sweeper"
+        )
+        return
+    app.job_queue.run_repeating(sweep_job, interval=SWEEP_INTERVAL, first=SWEEP_INTERVAL, name="booking_sweeper")
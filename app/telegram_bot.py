@@ -1,16 +1,24 @@
 from telegram import (
     Update, InlineKeyboardButton, InlineKeyboardMarkup,
-    ReplyKeyboardMarkup, ReplyKeyboardRemove
+    ReplyKeyboardMarkup, ReplyKeyboardRemove,
+    InlineQueryResultArticle, InputTextMessageContent
 )
 from telegram.ext import (
     Application, CommandHandler, MessageHandler, CallbackQueryHandler,
-    ContextTypes, ConversationHandler, filters
+    ContextTypes, ConversationHandler, InlineQueryHandler, TypeHandler, filters
 )
-from datetime import datetime
+from datetime import date, datetime
+import asyncio
 import logging
-from typing import Dict, Optional, List
-from app.firestore import check_availability, get_available_rooms, create_booking, cancel_booking, update_booking, get_room_availability
-from app.openai_helper import parse_booking_text
+import os
+from typing import Dict, Hashable, Optional, List
+from app.firestore import RoomUnavailableError, check_availability, get_available_rooms, create_booking, cancel_booking, update_bookings, get_room_availability
+from app.openai_helper import ParserUnavailableError, parse_booking_text
+from app.alternatives import find_alternatives
+from app.idempotency import IDEMPOTENCY_TTL, forget_booking, make_keys, run_once
+from app.inline_search import INLINE_CACHE_TIME, filter_rooms, parse_inline_query, search_rooms
+from app.properties import bind_chat_property, get_chat_property, list_properties
+from app.resilience import begin_update, degraded_dependencies, get_breaker_metrics
 
 # Khởi tạo logger
 logger = logging.getLogger(__name__)
@@ -18,9 +26,54 @@ logger = logging.getLogger(__name__)
 # Trạng thái conversation
 GET_BOOKING_DATES, GET_GUEST_INFO = range(2)
 
+# Số update được xử lý đồng thời (giữa các chat khác nhau)
+CONCURRENT_UPDATES = int(os.getenv("CONCURRENT_UPDATES", "32"))
+
 # ========== CORE FUNCTIONS ==========
+class ChatOrderedApplication(Application):
+    """
+    Application xử lý song song update của các chat khác nhau nhưng vẫn tuần
+    tự trong cùng một chat (hoặc cùng một người dùng với inline query), để
+    ConversationHandler và user_data không bị hai update của một chat chen nhau.
+    """
+
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        # key -> [lock, số update đang giữ/chờ lock]
+        self._chat_locks: Dict[Hashable, list] = {}
+
+    @staticmethod
+    def _order_key(update: object) -> Optional[Hashable]:
+        if not isinstance(update, Update):
+            return None
+        if update.effective_chat is not None:
+            return update.effective_chat.id
+        if update.effective_user is not None:
+            return update.effective_user.id
+        return None
+
+    async def process_update(self, update: object) -> None:
+        key = self._order_key(update)
+        if key is None:
+            await super().process_update(update)
+            return
+        entry = self._chat_locks.get(key)
+        if entry is None:
+            entry = self._chat_locks[key] = [asyncio.Lock(), 0]
+        entry[1] += 1
+        try:
+            async with entry[0]:
+                await super().process_update(update)
+        finally:
+            entry[1] -= 1
+            if entry[1] == 0:
+                del self._chat_locks[key]
+
 def setup_handlers(app: Application) -> None:
     """Thiết lập tất cả handlers cho bot"""
+    # Đặt deadline cho mỗi update trước khi các handler khác chạy
+    app.add_handler(TypeHandler(Update, start_update), group=-1)
+
     # Command handlers
     app.add_handler(CommandHandler("start", start))
     app.add_handler(CommandHandler("help", help_command))
@@ -29,6 +82,8 @@ def setup_handlers(app: Application) -> None:
     app.add_handler(CommandHandler("update", update_booking_command))
     app.add_handler(CommandHandler("today", today_checkins))
     app.add_handler(CommandHandler("schedule", check_room_schedule))
+    app.add_handler(CommandHandler("property", property_command))
+    app.add_handler(CommandHandler("status", status_command))
     
     # Booking conversation handler
     conv_handler = ConversationHandler(
@@ -50,10 +105,56 @@ def setup_handlers(app: Application) -> None:
     
     # Callback handlers
     app.add_handler(CallbackQueryHandler(button_handler))
+
+    # Inline mode: @bot 25/12 27/12 family
+    app.add_handler(InlineQueryHandler(inline_room_search))
     
     # Message handler (xử lý tin nhắn tự nhiên)
     app.add_handler(MessageHandler(filters.TEXT & ~filters.COMMAND, handle_natural_message))
 
+async def start_update(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """Bắt đầu deadline xử lý cho update (truyền xuống các lời gọi Firestore/OpenAI)"""
+    begin_update()
+
+def stale_notice() -> str:
+    """Ghi chú khi kết quả được lấy từ dữ liệu dự phòng"""
+    if "firestore" in degraded_dependencies():
+        return "\n\n⚠️ Hệ thống đang chậm, danh sách có thể chưa cập nhật. Phòng sẽ được kiểm tra lại khi đặt."
+    return ""
+
+async def suggest_guided_booking(update: Update) -> None:
+    """Chế độ dự phòng khi ChatGPT không phản hồi: chuyển sang đặt phòng từng bước (/book)"""
+    keyboard = [[InlineKeyboardButton("🛎️ Đặt phòng từng bước", callback_data="book")]]
+    await update.message.reply_text(
+        "⚠️ Hệ thống phân tích tin nhắn đang quá tải.\n"
+        "Bạn có thể đặt phòng từng bước (hoặc dùng lệnh /book):",
+        reply_markup=InlineKeyboardMarkup(keyboard)
+    )
+
+def current_property(update: Update) -> str:
+    """Cơ sở mà chat hiện tại đang làm việc"""
+    return get_chat_property(update.effective_chat.id)
+
+def format_alternatives(suggestions: List[Dict]) -> str:
+    """Hiển thị danh sách phương án thay thế cho khách"""
+    def fmt(date_str: str) -> str:
+        return datetime.strptime(date_str, "%Y-%m-%d").strftime("%d/%m/%Y")
+
+    labels = {
+        "same_dates": "Phòng khác cùng ngày",
+        "shift": "Dời ngày",
+        "shorter": "Ở ngắn hơn",
+        "split": "Chia 2 phòng",
+    }
+    msg = "💡 Gợi ý thay thế:"
+    for suggestion in suggestions:
+        parts = [
+            f"{r['name']} ({r['type']}) {fmt(r['check_in'])} → {fmt(r['check_out'])}"
+            for r in suggestion["rooms"]
+        ]
+        msg += f"\n▪ {labels.get(suggestion['kind'], suggestion['kind'])}: " + " + ".join(parts)
+    return msg
+
 # ========== COMMAND HANDLERS ==========
 async def start(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     """Xử lý lệnh /start - Hiển thị menu chính"""
@@ -81,8 +182,11 @@ async def help_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> No
     • /book - Đặt phòng mới
     • /check <ngày đến> <ngày đi> - Kiểm tra phòng trống
     • /cancel <mã booking> - Hủy đặt phòng
-    • /update <mã booking> <field>:<giá trị> - Cập nhật thông tin
+    • /update <mã booking> <field>:<giá trị> - Cập nhật thông tin (nhiều mã cách nhau bởi dấu phẩy, dời lịch: shiftDays:1)
     • /today - Xem danh sách check-in hôm nay
+    • /property [mã cơ sở] - Xem/chuyển cơ sở đang làm việc
+    • /status - Trạng thái kết nối Firestore/OpenAI
+    • @tên_bot 25/12 27/12 family - Tra phòng trống ở bất kỳ chat nào
     
     💡 Bạn cũng có thể chat trực tiếp:
     "Đặt phòng Deluxe cho Nguyễn Văn A từ 25/12 đến 27/12"
@@ -126,24 +230,36 @@ async def get_booking_dates(update: Update, context: ContextTypes.DEFAULT_TYPE)
         context.user_data["check_out"] = check_out
         
         # Lấy danh sách phòng trống
-        rooms = get_available_rooms(check_in, check_out)
+        property_id = current_property(update)
+        context.user_data["property_id"] = property_id
+        rooms = get_available_rooms(check_in, check_out, property_id)
         
         if not rooms:
-            await update.message.reply_text("⛔ Không có phòng trống trong khoảng thời gian này!")
-            return ConversationHandler.END
+            suggestions = [] if "firestore" in degraded_dependencies() else find_alternatives(
+                check_in, check_out, property_id=property_id
+            )
+            if not suggestions:
+                await update.message.reply_text("⛔ Không có phòng trống trong khoảng thời gian này!" + stale_notice())
+                return ConversationHandler.END
+            await update.message.reply_text(
+                "⛔ Không có phòng trống trong khoảng thời gian này!\n"
+                + format_alternatives(suggestions)
+                + "\n\nNhập lại ngày (dd/mm/yyyy dd/mm/yyyy) để chọn phương án khác hoặc /cancel để thoát."
+            )
+            return GET_BOOKING_DATES
             
         # Tạo keyboard chọn phòng
         keyboard = [
             [InlineKeyboardButton(
-                f"{room['name']} - {room['type']} ({room['capacity']} người)", 
-                callback_data=f"room_{room['id']}")
+                f"{room.name} - {room.type} ({room.capacity} người)", 
+                callback_data=f"room_{room.id}")
             ] for room in rooms
         ]
         keyboard.append([InlineKeyboardButton("❌ Hủy", callback_data="cancel")])
         
         reply_markup = InlineKeyboardMarkup(keyboard)
         await update.message.reply_text(
-            "🔍 Chọn phòng bạn muốn đặt:",
+            "🔍 Chọn phòng bạn muốn đặt:" + stale_notice(),
             reply_markup=reply_markup
         )
         
@@ -202,8 +318,9 @@ async def cancel_booking_command(update: Update, context: ContextTypes.DEFAULT_T
             )
             return
         booking_id = args[0]
-        success = cancel_booking(booking_id)
+        success = cancel_booking(booking_id, current_property(update))
         if success:
+            forget_booking(booking_id)
             await update.message.reply_text(f"✅ Đã hủy booking {booking_id} thành công!")
         else:
             await update.message.reply_text(f"⚠️ Booking {booking_id} đã được hủy trước đó hoặc không tồn tại.")
@@ -214,15 +331,19 @@ async def cancel_booking_command(update: Update, context: ContextTypes.DEFAULT_T
         await update.message.reply_text("⚠️ Có lỗi xảy ra, vui lòng thử lại sau!")
 
 async def update_booking_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
-    """Xử lý lệnh /update <mã_booking> <field>:<giá trị> để cập nhật thông tin booking"""
+    """
+    Xử lý lệnh /update <mã_booking>[,<mã_booking>...] <field>:<giá trị> ...
+    Nhiều mã booking (cách nhau bởi dấu phẩy) được cập nhật cùng lúc, vd dời cả đoàn: shiftDays:1
+    """
     try:
         args = context.args
         if not args or len(args) < 2:
             await update.message.reply_text(
-                "⚠️ Vui lòng nhập đúng định dạng: /update <mã_booking> <field>:<giá trị>\nVí dụ: /update abc123 price:2000000"
+                "⚠️ Vui lòng nhập đúng định dạng: /update <mã_booking> <field>:<giá trị>\nVí dụ: /update abc123 price:2000000\n"
+                "Dời lịch nhiều booking: /update abc123,def456 shiftDays:1"
             )
             return
-        booking_id = args[0]
+        booking_ids = [booking_id for booking_id in args[0].split(",") if booking_id]
         updates = {}
         for item in args[1:]:
             if ':' in item:
@@ -231,11 +352,13 @@ async def update_booking_command(update: Update, context: ContextTypes.DEFAULT_T
         if not updates:
             await update.message.reply_text("⚠️ Không có trường nào để cập nhật.")
             return
-        success = update_booking(booking_id, updates)
-        if success:
-            await update.message.reply_text(f"✅ Đã cập nhật booking {booking_id} thành công!")
-        else:
-            await update.message.reply_text(f"⚠️ Không thể cập nhật booking {booking_id}.")
+        written = update_bookings(
+            {booking_id: updates for booking_id in booking_ids}, current_property(update)
+        )
+        msg = "✅ Đã cập nhật thành công!"
+        for booking_id, values in written.items():
+            msg += f"\n▪ {booking_id}: " + ", ".join(f"{field}={value}" for field, value in values.items())
+        await update.message.reply_text(msg)
     except ValueError as e:
         await update.message.reply_text(f"❌ Lỗi: {str(e)}")
     except Exception as e:
@@ -268,19 +391,54 @@ async def handle_natural_message(update: Update, context: ContextTypes.DEFAULT_T
         message = update.message.text
         # Kiểm tra nếu là yêu cầu đặt phòng
         if any(keyword in message.lower() for keyword in ["đặt phòng", "book", "đặt"]):
-            booking_data = await parse_booking_text(message)
-            booking_id = create_booking(booking_data)
+            keys = make_keys(update.effective_chat.id, update.update_id, message)
+            property_id = current_property(update)
+
+            async def _create() -> Dict:
+                booking_data = await parse_booking_text(message)
+                booking_id = create_booking(booking_data, keys, IDEMPOTENCY_TTL, property_id)
+                return {
+                    "booking_id": booking_id,
+                    "room_id": booking_data["room_id"],
+                    "guest_name": booking_data["guest_name"],
+                    "deposit": booking_data["deposit"]
+                }
+
+            # Update gửi lại hoặc bấm trùng sẽ nhận lại booking cũ, không gọi lại LLM/Firestore
+            try:
+                result, _ = await run_once(keys, _create)
+            except ParserUnavailableError:
+                # Chỉ lỗi phía ChatGPT mới chuyển sang /book; lỗi Firestore báo lỗi chung
+                await suggest_guided_booking(update)
+                return
+            except RoomUnavailableError as e:
+                # Gợi ý phòng khác (ưu tiên cùng loại) hoặc ngày khác cho đúng yêu cầu của khách
+                msg = f"⛔ {str(e)}"
+                suggestions = [] if "firestore" in degraded_dependencies() else find_alternatives(
+                    e.check_in, e.check_out, room_id=e.room_id, property_id=property_id
+                )
+                if suggestions:
+                    msg += "\n" + format_alternatives(suggestions)
+                else:
+                    msg += "\nVui lòng chọn phòng khác hoặc dùng lệnh /book để đặt phòng"
+                await update.message.reply_text(msg + stale_notice())
+                return
             await update.message.reply_text(
                 f"✅ Đặt phòng thành công!\n"
-                f"▪ Mã: {booking_id}\n"
-                f"▪ Phòng: {booking_data['room_id']}\n"
-                f"▪ Khách: {booking_data['guest_name']}\n"
-                f"▪ Cọc: {booking_data['deposit']:,} VND"
+                f"▪ Mã: {result['booking_id']}\n"
+                f"▪ Phòng: {result['room_id']}\n"
+                f"▪ Khách: {result['guest_name']}\n"
+                f"▪ Cọc: {result['deposit']:,} VND"
             )
         else:
             await update.message.reply_text(
                 "Tôi không hiểu yêu cầu của bạn. Vui lòng dùng lệnh /help để xem hướng dẫn"
             )
+    except ValueError as e:
+        # Tin nhắn thiếu thông tin (giá, cọc, SĐT...) hoặc ngày không hợp lệ
+        await update.message.reply_text(
+            f"❌ Lỗi: {str(e)}\nVui lòng gửi lại đầy đủ thông tin hoặc dùng lệnh /book để đặt phòng"
+        )
     except Exception as e:
         logger.error(f"Lỗi xử lý tin nhắn tự nhiên: {str(e)}")
         await update.message.reply_text(
@@ -300,7 +458,7 @@ async def check_room_schedule(update: Update, context: ContextTypes.DEFAULT_TYPE
             return
 
         room_id, start_date, end_date = args
-        availability = get_room_availability(room_id, start_date, end_date)
+        availability = get_room_availability(room_id, start_date, end_date, current_property(update))
 
         if availability["available"]:
             message = f"✅ Phòng {room_id} TRỐNG từ {start_date} đến {end_date}"
@@ -308,8 +466,8 @@ async def check_room_schedule(update: Update, context: ContextTypes.DEFAULT_TYPE
             message = f"⛔ Phòng {room_id} ĐÃ ĐẶT trong khoảng thời gian:\n"
             for booking in availability["bookings"]:
                 message += (
-                    f"\n▪ {booking['check_in']} → {booking['check_out']} "
-                    f"({booking['status']})"
+                    f"\n▪ {booking.check_in} → {booking.check_out} "
+                    f"({booking.status})"
                 )
 
         await update.message.reply_text(message)
@@ -329,16 +487,20 @@ async def handle_availability_request(update, context):
     message = update.message.text
     req = parse_availability_request(message)
     if req.get("start_date") and req.get("end_date"):
-        rooms = get_all_available_rooms(req["start_date"], req["end_date"])
+        property_id = current_property(update)
+        rooms = get_all_available_rooms(req["start_date"], req["end_date"], property_id)
         if not rooms:
-            await update.message.reply_text(
-                f"⛔ Không có phòng nào trống từ {req['start_date']} đến {req['end_date']}!"
-            )
+            msg = f"⛔ Không có phòng nào trống từ {req['start_date']} đến {req['end_date']}!"
+            if "firestore" not in degraded_dependencies():
+                suggestions = find_alternatives(req["start_date"], req["end_date"], property_id=property_id)
+                if suggestions:
+                    msg += "\n" + format_alternatives(suggestions)
+            await update.message.reply_text(msg + stale_notice())
         else:
             msg = f"🏠 Danh sách phòng trống từ {req['start_date']} đến {req['end_date']}:\n"
             for room in rooms:
-                msg += f"\n- {room['name']} (Loại: {room['type']}, Sức chứa: {room['capacity']})"
-            await update.message.reply_text(msg)
+                msg += f"\n- {room.name} (Loại: {room.type}, Sức chứa: {room.capacity})"
+            await update.message.reply_text(msg + stale_notice())
         return True
     return False
 
@@ -346,20 +508,102 @@ async def today_checkins(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
     """Xử lý lệnh /today - Hiển thị danh sách check-in hôm nay"""
     try:
         from app.firestore import get_today_checkins
-        bookings = get_today_checkins()
+        bookings = get_today_checkins(current_property(update))
         if not bookings:
             await update.message.reply_text("⛔ Không có khách nào check-in hôm nay.")
             return
         msg = "📋 Danh sách check-in hôm nay:\n"
         for b in bookings:
             msg += (
-                f"\n▪ Mã: {b['id']} | Phòng: {b.get('roomId', '')} | Khách: {b.get('guestName', '')} | SĐT: {b.get('phone', '')}"
+                f"\n▪ Mã: {b.id} | Phòng: {b.room_id} | Khách: {b.guest_name} | SĐT: {b.phone}"
             )
         await update.message.reply_text(msg)
     except Exception as e:
         logger.error(f"Lỗi khi lấy danh sách check-in hôm nay: {str(e)}")
         await update.message.reply_text("⚠️ Có lỗi xảy ra, vui lòng thử lại sau!")
 
+async def property_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """Xử lý lệnh /property [mã cơ sở] - Xem hoặc chuyển cơ sở đang làm việc"""
+    try:
+        chat_id = update.effective_chat.id
+        if context.args:
+            property_id = context.args[0]
+            if bind_chat_property(chat_id, property_id):
+                await update.message.reply_text(f"✅ Đã chuyển sang cơ sở {property_id}")
+            else:
+                await update.message.reply_text(f"⚠️ Cơ sở {property_id} không tồn tại.")
+            return
+        current = get_chat_property(chat_id)
+        msg = f"🏨 Cơ sở hiện tại: {current}\n\nDanh sách cơ sở:"
+        for prop in list_properties():
+            marker = "▶" if prop["id"] == current else "▪"
+            msg += f"\n{marker} {prop['id']} - {prop.get('name', '')}"
+        msg += "\n\nDùng /property <mã cơ sở> để chuyển."
+        await update.message.reply_text(msg)
+    except Exception as e:
+        logger.error(f"Lỗi khi xử lý lệnh /property: {str(e)}")
+        await update.message.reply_text("⚠️ Có lỗi xảy ra, vui lòng thử lại sau!")
+
+async def inline_room_search(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """Inline mode - Tra phòng trống: @tên_bot <ngày đến> [ngày đi] [loại phòng/số người]"""
+    query = update.inline_query
+    cache_time = INLINE_CACHE_TIME
+
+    def fmt(date_str: str) -> str:
+        return datetime.strptime(date_str, "%Y-%m-%d").strftime("%d/%m/%Y")
+
+    try:
+        check_in, check_out, keywords = parse_inline_query(query.query, date.today())
+        property_id = get_chat_property(query.from_user.id)
+        rooms = filter_rooms(search_rooms(check_in, check_out, property_id), keywords)
+        dates = f"{fmt(check_in)} → {fmt(check_out)}"
+        results = [
+            InlineQueryResultArticle(
+                id=f"{room.id}:{check_in}:{check_out}",
+                title=f"{room.name} - {room.type} ({room.capacity} người)",
+                description=f"Trống {dates}",
+                input_message_content=InputTextMessageContent(
+                    f"🏠 {room.name} ({room.type}, {room.capacity} người) còn trống {dates}"
+                )
+            ) for room in rooms[:50]
+        ]
+        if not results:
+            results = [InlineQueryResultArticle(
+                id="empty",
+                title="⛔ Không có phòng trống",
+                description=dates,
+                input_message_content=InputTextMessageContent(f"⛔ Không có phòng trống {dates}")
+            )]
+        if "firestore" in degraded_dependencies():
+            cache_time = 0
+    except ValueError as e:
+        cache_time = 0
+        results = [InlineQueryResultArticle(
+            id="error",
+            title=f"❌ {str(e)}",
+            description="Ví dụ: 25/12 27/12 family",
+            input_message_content=InputTextMessageContent("Tra phòng trống: @tên_bot 25/12 27/12 family")
+        )]
+    except Exception as e:
+        logger.error(f"Lỗi khi tra phòng inline: {str(e)}")
+        cache_time = 0
+        results = []
+
+    # is_personal: mỗi người dùng có thể đang làm việc với cơ sở khác nhau
+    await query.answer(results, cache_time=cache_time, is_personal=True)
+
+async def status_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """Xử lý lệnh /status - Trạng thái circuit breaker của Firestore/OpenAI"""
+    labels = {"closed": "🟢 bình thường", "half_open": "🟡 đang thử lại", "open": "🔴 tạm ngưng"}
+    msg = "📊 Trạng thái hệ thống:"
+    for name, metrics in get_breaker_metrics().items():
+        p95 = f"{metrics['p95_ms']:.0f}ms" if metrics["p95_ms"] is not None else "-"
+        msg += (
+            f"\n▪ {name}: {labels[metrics['state']]} | lỗi {metrics['window_failure_rate']:.0%} "
+            f"/ {metrics['window_calls']} lời gọi gần đây | p95 {p95} | từ chối {metrics['rejected']}"
+        )
+    await update.message.reply_text(msg)
+
 async def cancel_booking_conv(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
     """Fallback khi người dùng muốn hủy quy trình đặt phòng"""
     await update.message.reply_text("Đã hủy quy trình đặt phòng.")
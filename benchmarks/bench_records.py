@@ -0,0 +1,97 @@
+"""
+So sánh dict đầy đủ của document với record gọn (__slots__) + projection.
+Chạy: python -m benchmarks.bench_records
+"""
+import json
+import tracemalloc
+from datetime import datetime
+
+from app.models import Booking, Room
+
+N = 10000
+
+class _FakeSnapshot:
+    """Giả lập DocumentSnapshot, chỉ trả về các field được select()"""
+
+    def __init__(self, doc_id, data, fields=None):
+        self.id = doc_id
+        self.exists = True
+        self._data = data if fields is None else {k: data[k] for k in fields if k in data}
+
+    def to_dict(self):
+        return dict(self._data)
+
+def _booking_doc(i):
+    return {
+        "roomId": f"{100 + i % 8}",
+        "guestName": f"Nguyễn Văn {i}",
+        "phone": "0912345678",
+        "checkIn": "2024-12-25",
+        "checkOut": "2024-12-27",
+        "price": 1500000,
+        "deposit": 500000,
+        "status": "confirmed",
+        "createdAt": datetime(2024, 12, 1, 10, 30).isoformat(),
+        "notes": "Khách yêu cầu phòng yên tĩnh, đến muộn sau 22h, cần xe đón ở bến xe Liên tỉnh Đà Lạt",
+    }
+
+def _room_doc(i):
+    return {"name": f"Room {i}", "type": "Deluxe Double", "status": "available", "capacity": 2}
+
+def _payload_bytes(docs, fields=None):
+    total = 0
+    for doc in docs:
+        data = doc if fields is None else {k: doc[k] for k in fields if k in doc}
+        total += len(json.dumps(data, ensure_ascii=False).encode("utf-8"))
+    return total
+
+def _memory_per_record(build):
+    tracemalloc.start()
+    before = tracemalloc.take_snapshot()
+    records = build()
+    after = tracemalloc.take_snapshot()
+    tracemalloc.stop()
+    size = sum(stat.size_diff for stat in after.compare_to(before, "filename"))
+    return size / len(records)
+
+def _report(name, full, compact):
+    saved = 100 * (1 - compact / full) if full else 0
+    print(f"{name:<40} {full:>12,.0f} {compact:>12,.0f} {saved:>8.1f}%")
+
+def main():
+    booking_docs = [_booking_doc(i) for i in range(N)]
+    room_docs = [_room_doc(i) for i in range(N)]
+
+    print(f"{'':<40} {'dict':>12} {'record':>12} {'giảm':>9}")
+    _report("Bytes/booking (lịch phòng)",
+            _payload_bytes(booking_docs) / N,
+            _payload_bytes(booking_docs, Booking.SCHEDULE_FIELDS) / N)
+    _report("Bytes/booking (check-in hôm nay)",
+            _payload_bytes(booking_docs) / N,
+            _payload_bytes(booking_docs, Booking.CHECKIN_FIELDS) / N)
+    _report("Bytes/room (danh sách phòng)",
+            _payload_bytes(room_docs) / N,
+            _payload_bytes(room_docs, Room.LISTING_FIELDS) / N)
+
+    # Cách cũ: to_dict() rồi chép sang dict mới
+    _report("Bộ nhớ/booking",
+            _memory_per_record(lambda: [
+                {"id": f"b{i}", **_FakeSnapshot(f"b{i}", doc).to_dict()}
+                for i, doc in enumerate(booking_docs)
+            ]),
+            _memory_per_record(lambda: [
+                Booking.from_snapshot(_FakeSnapshot(f"b{i}", doc, Booking.SCHEDULE_FIELDS))
+                for i, doc in enumerate(booking_docs)
+            ]))
+    _report("Bộ nhớ/room",
+            _memory_per_record(lambda: [
+                {**_FakeSnapshot(str(i), doc).to_dict(), "id": str(i)}
+                for i, doc in enumerate(room_docs)
+            ]),
+            _memory_per_record(lambda: [
+                Room.from_snapshot(_FakeSnapshot(str(i), doc, Room.LISTING_FIELDS))
+                for i, doc in enumerate(room_docs)
+            ]))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,102 @@
+"""
+So sánh các cách dời lịch cả đoàn (bulk date shift) trên Firestore giả lập:
+    - ghi thẳng: đọc rồi update từng booking, không kiểm tra trùng lịch (cách cũ)
+    - từng booking: update_booking cho mỗi booking (mỗi booking một transaction)
+    - một lần: update_bookings cho cả đoàn (một transaction, một commit)
+Đoàn gồm nhiều phòng, mỗi phòng hai lượt ở nối tiếp nhau, nên dời từng
+booking theo thứ tự có thể va vào chính lượt sau của đoàn.
+Số round trip (rpcs) là chi phí chính khi chạy với Firestore thật.
+
+Chạy: python -m benchmarks.bench_updates [--groups 50] [--abort-rate 0.2]
+"""
+import argparse
+import logging
+import random
+import time
+from datetime import date, timedelta
+
+from app.main import ROOMS_DATA
+from benchmarks.fakes import install_fake_firestore
+
+def _seed(client, groups, rooms_per_group):
+    """Tạo các đoàn (mỗi đoàn rooms_per_group phòng x 2 lượt) và booking lẻ xen kẽ"""
+    rooms = [room["id"] for room in ROOMS_DATA]
+    start = date.today() + timedelta(days=30)
+    bookings = client.collection("bookings")
+    group_ids = []
+    for g in range(groups):
+        # Mỗi đoàn chiếm một tuần riêng, cách đoàn sau 1 tuần trống để dời được
+        check_in = start + timedelta(days=14 * g)
+        ids = []
+        for room_id in random.sample(rooms, rooms_per_group):
+            for stay in range(2):
+                ci = check_in + timedelta(days=3 * stay)
+                ref = bookings.document()
+                ref.set({
+                    "roomId": room_id, "guestName": f"Đoàn {g}", "phone": "0912345678",
+                    "checkIn": ci.isoformat(), "checkOut": (ci + timedelta(days=2)).isoformat(),
+                    "price": 1500000, "deposit": 500000, "status": "confirmed", "notes": "",
+                })
+                ids.append(ref.id)
+        group_ids.append(ids)
+    return group_ids
+
+def _shift_blind(group, days):
+    """Cách cũ: caller tự đọc ngày rồi ghi thẳng từng booking"""
+    import app.firestore as fs
+
+    for booking_id in group:
+        ref = fs.db.collection("bookings").document(booking_id)
+        doc = ref.get(field_paths=["checkIn", "checkOut"])
+        ref.update({
+            key: (date.fromisoformat(doc.get(key)) + timedelta(days=days)).isoformat()
+            for key in ("checkIn", "checkOut")
+        })
+
+def _shift_each(group, days):
+    from app.firestore import update_booking
+
+    # Dời lượt sau trước để tránh va vào lượt sau của chính đoàn khi dời về sau
+    for booking_id in reversed(group):
+        update_booking(booking_id, {"shiftDays": days})
+
+def _shift_batch(group, days):
+    from app.firestore import update_bookings
+
+    update_bookings({booking_id: {"shiftDays": days} for booking_id in group})
+
+METHODS = [("ghi thẳng", _shift_blind), ("từng booking", _shift_each), ("một lần", _shift_batch)]
+
+def run(args):
+    print(f"{args.groups} đoàn x {args.rooms * 2} booking, dời +1 ngày, abort_rate {args.abort_rate}")
+    print(f"{'cách':<14} {'ms/đoàn':>9} {'rpcs/đoàn':>10} {'commit/đoàn':>12} {'abort':>6} {'lỗi':>5}")
+    for name, shift in METHODS:
+        random.seed(args.seed)
+        client = install_fake_firestore(ROOMS_DATA)
+        groups = _seed(client, args.groups, args.rooms)
+        client.abort_rate = args.abort_rate
+        before = client.stats()
+        failures = 0
+        started = time.perf_counter()
+        for group in groups:
+            try:
+                shift(group, 1)
+            except Exception:
+                failures += 1
+        elapsed = time.perf_counter() - started
+        after = client.stats()
+        per_group = {key: (after[key] - before[key]) / args.groups for key in after}
+        print(f"{name:<14} {1000 * elapsed / args.groups:>9.2f} {per_group['rpcs']:>10.1f} "
+              f"{per_group['commits']:>12.1f} {after['aborts'] - before['aborts']:>6} {failures:>5}")
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark dời lịch nhiều booking")
+    parser.add_argument("--groups", type=int, default=50, help="Số đoàn")
+    parser.add_argument("--rooms", type=int, default=4, help="Số phòng mỗi đoàn")
+    parser.add_argument("--abort-rate", type=float, default=0.0, help="Xác suất commit bị tranh chấp")
+    parser.add_argument("--seed", type=int, default=42)
+    logging.disable(logging.CRITICAL)
+    run(parser.parse_args())
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,90 @@
+"""
+So sánh các phiên bản prompt trích xuất booking trên một bộ tin nhắn cố định:
+độ chính xác theo field, token prompt/completion và độ trễ mỗi lần gọi.
+Mọi phiên bản đều trả kết quả qua validate_booking nên được so trên cùng
+định dạng (tiền là số nguyên VND); kết quả không hợp lệ tính là lỗi.
+Cần OPENAI_API_KEY (gọi API thật).
+
+Chạy: python -m benchmarks.eval_booking_prompt [--versions legacy structured]
+"""
+import argparse
+import asyncio
+import time
+from datetime import date
+
+from app.openai_helper import (
+    BOOKING_FIELDS, PROMPT_VERSIONS, _parse_single, init_openai, llm_call_stats
+)
+
+# Ngày cố định để ngày tương đối ("25/12") có đáp án xác định
+TODAY = date(2024, 12, 1)
+
+EVAL_SET = [
+    ("Đặt phòng room_101 cho Nguyễn Văn A từ 25/12 đến 27/12 giá 1.500.000, cọc 500k, sđt 0912345678",
+     {"guest_name": "Nguyễn Văn A", "phone": "0912345678", "room_id": "room_101",
+      "check_in": "2024-12-25", "check_out": "2024-12-27", "price": 1500000, "deposit": 500000}),
+    ("book 203 cho chị Lê Thị Hoa 0987654321, 30/12 - 02/01, giá 1tr2, cọc 400k",
+     {"guest_name": "Lê Thị Hoa", "phone": "0987654321", "room_id": "203",
+      "check_in": "2024-12-30", "check_out": "2025-01-02", "price": 1200000, "deposit": 400000}),
+    ("Đặt phòng 301 cho anh trần minh, sdt 0901234567, nhận 05/12/2024 trả 07/12/2024, giá 800.000 cọc 200.000",
+     {"guest_name": "Trần Minh", "phone": "0901234567", "room_id": "301",
+      "check_in": "2024-12-05", "check_out": "2024-12-07", "price": 800000, "deposit": 200000}),
+    ("đặt 102 cho Phạm Quốc Bảo từ 10/12 đến 11/12, 350k, cọc 100k, sđt 0933111222",
+     {"guest_name": "Phạm Quốc Bảo", "phone": "0933111222", "room_id": "102",
+      "check_in": "2024-12-10", "check_out": "2024-12-11", "price": 350000, "deposit": 100000}),
+    ("Khách Đỗ Hải Yến 0977000111 đặt phòng 201 ngày 24/12 đến 26/12 giá 2 triệu, cọc 1 triệu",
+     {"guest_name": "Đỗ Hải Yến", "phone": "0977000111", "room_id": "201",
+      "check_in": "2024-12-24", "check_out": "2024-12-26", "price": 2000000, "deposit": 1000000}),
+    ("Đặt phòng 103 cho Vũ Ngọc Lan (0911222333) 15/01 - 18/01, giá 1.100.000/đêm, đã cọc 500.000",
+     {"guest_name": "Vũ Ngọc Lan", "phone": "0911222333", "room_id": "103",
+      "check_in": "2025-01-15", "check_out": "2025-01-18", "price": 1100000, "deposit": 500000}),
+]
+
+def _normalize(value):
+    return str(value).strip().lower()
+
+async def evaluate(version: str):
+    correct = 0
+    total = 0
+    failures = 0
+    latencies = []
+    for text, expected in EVAL_SET:
+        started = time.perf_counter()
+        try:
+            result = await _parse_single(text, version=version, today=TODAY)
+        except Exception:
+            failures += 1
+            total += len(BOOKING_FIELDS)
+            continue
+        finally:
+            latencies.append(time.perf_counter() - started)
+        for field in BOOKING_FIELDS:
+            total += 1
+            correct += _normalize(result.get(field)) == _normalize(expected[field])
+    stats = llm_call_stats.get(version, {})
+    calls = stats.get("calls", 0) or 1
+    latencies.sort()
+    return {
+        "accuracy": correct / total if total else 0,
+        "failures": failures,
+        "prompt_tokens": stats.get("prompt_tokens", 0) / calls,
+        "completion_tokens": stats.get("completion_tokens", 0) / calls,
+        "p50_ms": 1000 * latencies[len(latencies) // 2],
+        "max_ms": 1000 * latencies[-1],
+    }
+
+async def run(versions):
+    init_openai()
+    print(f"{'version':<12} {'accuracy':>9} {'lỗi':>5} {'prompt tok':>11} {'compl tok':>10} {'p50 ms':>8} {'max ms':>8}")
+    for version in versions:
+        r = await evaluate(version)
+        print(f"{version:<12} {r['accuracy']:>9.1%} {r['failures']:>5} {r['prompt_tokens']:>11.0f} "
+              f"{r['completion_tokens']:>10.0f} {r['p50_ms']:>8.0f} {r['max_ms']:>8.0f}")
+
+def main():
+    parser = argparse.ArgumentParser(description="Đánh giá prompt trích xuất booking")
+    parser.add_argument("--versions", nargs="+", default=list(PROMPT_VERSIONS), choices=PROMPT_VERSIONS)
+    asyncio.run(run(parser.parse_args().versions))
+
+if __name__ == "__main__":
+    main()
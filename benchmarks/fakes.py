@@ -0,0 +1,283 @@
+"""
+Firestore giả lập trong bộ nhớ cho benchmark/load test.
+Chỉ hỗ trợ phần API mà app/firestore.py đang dùng.
+"""
+import copy
+import random
+import uuid
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from types import SimpleNamespace
+
+SERVER_TIMESTAMP = object()
+
+_OPS = {
+    "==": lambda a, b: a == b,
+    "!=": lambda a, b: a != b,
+    "<": lambda a, b: a < b,
+    "<=": lambda a, b: a <= b,
+    ">": lambda a, b: a > b,
+    ">=": lambda a, b: a >= b,
+    "in": lambda a, b: a in b,
+    "not-in": lambda a, b: a not in b,
+    "array_contains": lambda a, b: b in (a or []),
+}
+
+def _resolve(data):
+    now = datetime.now(timezone.utc)
+    return {k: (now if v is SERVER_TIMESTAMP else v) for k, v in data.items()}
+
+class FakeSnapshot:
+    def __init__(self, reference, data, field_paths=None):
+        self.reference = reference
+        self.id = reference.id
+        self.exists = data is not None
+        if data is not None and field_paths is not None:
+            data = {k: data[k] for k in field_paths if k in data}
+        self._data = data
+        self.read_bytes = len(repr(data)) if data is not None else 0
+
+    def to_dict(self):
+        return copy.copy(self._data) if self._data is not None else None
+
+    def get(self, field):
+        if self._data is None or field not in self._data:
+            raise KeyError(field)
+        return self._data[field]
+
+class FakeDocumentRef:
+    def __init__(self, collection, doc_id):
+        self._collection = collection
+        self.id = doc_id
+        self.path = f"{collection.path}/{doc_id}"
+
+    def get(self, field_paths=None, transaction=None, **kwargs):
+        self._collection._client._rpc()
+        self._collection._client.reads += 1
+        return FakeSnapshot(self, self._collection._docs.get(self.id), field_paths)
+
+    def set(self, data, merge=False, **kwargs):
+        self._collection._client._rpc()
+        self._collection._client.writes += 1
+        docs = self._collection._docs
+        if merge and self.id in docs:
+            docs[self.id].update(_resolve(data))
+        else:
+            docs[self.id] = _resolve(data)
+
+    def update(self, data, **kwargs):
+        self._collection._client._rpc()
+        self._collection._client.writes += 1
+        docs = self._collection._docs
+        if self.id not in docs:
+            raise ValueError(f"No document to update: {self.path}")
+        docs[self.id].update(_resolve(data))
+
+    def delete(self):
+        self._collection._client._rpc()
+        self._collection._client.writes += 1
+        self._collection._docs.pop(self.id, None)
+
+    def collection(self, name):
+        return self._collection._client.collection(f"{self.path}/{name}")
+
+class FakeQuery:
+    def __init__(self, collection, filters=(), projection=None, limit=None,
+                 orders=(), cursor=None):
+        self._collection = collection
+        self._filters = tuple(filters)
+        self._projection = projection
+        self._limit = limit
+        self._orders = tuple(orders)
+        self._cursor = cursor
+
+    def _copy(self, **changes):
+        params = dict(filters=self._filters, projection=self._projection, limit=self._limit,
+                      orders=self._orders, cursor=self._cursor)
+        params.update(changes)
+        return FakeQuery(self._collection, **params)
+
+    def where(self, field_path=None, op_string=None, value=None, filter=None):
+        if filter is not None:
+            field_path, op_string, value = filter.field_path, filter.op_string, filter.value
+        return self._copy(filters=self._filters + ((field_path, op_string, value),))
+
+    def select(self, field_paths):
+        return self._copy(projection=tuple(field_paths))
+
+    def limit(self, count):
+        return self._copy(limit=count)
+
+    def order_by(self, field_path, direction="ASCENDING"):
+        return self._copy(orders=self._orders + ((field_path, direction),))
+
+    def start_after(self, snapshot):
+        return self._copy(cursor=snapshot)
+
+    def _matches(self, data):
+        for field, op, value in self._filters:
+            if field not in data or not _OPS[op](data[field], value):
+                return False
+        return True
+
+    def stream(self, transaction=None, **kwargs):
+        client = self._collection._client
+        client.rpcs += 1
+        client.queries += 1
+        items = [(doc_id, data) for doc_id, data in list(self._collection._docs.items())
+                 if self._matches(data)]
+        for field, direction in reversed(self._orders):
+            items.sort(key=lambda item: item[1].get(field), reverse=direction == "DESCENDING")
+        if not self._orders:
+            items.sort(key=lambda item: item[0])
+        if self._cursor is not None:
+            ids = [doc_id for doc_id, _ in items]
+            if self._cursor.id in ids:
+                items = items[ids.index(self._cursor.id) + 1:]
+        if self._limit is not None:
+            items = items[:self._limit]
+        for doc_id, data in items:
+            client.reads += 1
+            snapshot = FakeSnapshot(self._collection.document(doc_id), data, self._projection)
+            client.bytes_read += snapshot.read_bytes
+            yield snapshot
+
+    def get(self, transaction=None, **kwargs):
+        return list(self.stream())
+
+class FakeCollection(FakeQuery):
+    def __init__(self, client, path):
+        super().__init__(self)
+        self._client = client
+        self.path = path
+        self.id = path.rsplit("/", 1)[-1]
+        self._docs = {}
+
+    def document(self, doc_id=None):
+        return FakeDocumentRef(self, doc_id or uuid.uuid4().hex[:20])
+
+class FakeWriteBatch:
+    def __init__(self, client):
+        self._client = client
+        self._ops = []
+
+    def set(self, ref, data, merge=False):
+        self._ops.append(lambda: ref.set(data, merge=merge))
+
+    def update(self, ref, data):
+        self._ops.append(lambda: ref.update(data))
+
+    def delete(self, ref):
+        self._ops.append(ref.delete)
+
+    def commit(self, **kwargs):
+        self._client.commits += 1
+        with self._client._grouped():
+            for op in self._ops:
+                op()
+        self._ops = []
+
+class FakeAborted(Exception):
+    """Giả lập lỗi Aborted khi transaction tranh chấp quá số lần thử"""
+
+class FakeTransaction(FakeWriteBatch):
+    """Transaction không cô lập: ghi được áp dụng khi commit"""
+
+    def __init__(self, client, max_attempts=5):
+        super().__init__(client)
+        self.max_attempts = max_attempts
+
+    def get(self, ref_or_query):
+        if isinstance(ref_or_query, FakeDocumentRef):
+            return ref_or_query.get()
+        return ref_or_query.stream()
+
+    def get_all(self, refs):
+        with self._client._grouped():
+            return [ref.get() for ref in refs]
+
+class FakeClient:
+    def __init__(self):
+        self._collections = {}
+        self.reads = 0
+        self.writes = 0
+        self.queries = 0
+        self.commits = 0
+        self.bytes_read = 0
+        # Số round trip tới server: get/ghi lẻ, mỗi query, mỗi get_all, mỗi commit
+        self.rpcs = 0
+        self._in_group = False
+        # Xác suất một lần commit transaction bị tranh chấp (phải chạy lại)
+        self.abort_rate = 0.0
+        self.aborts = 0
+        self._random = random.Random(0)
+
+    def collection(self, path):
+        if path not in self._collections:
+            self._collections[path] = FakeCollection(self, path)
+        return self._collections[path]
+
+    def batch(self):
+        return FakeWriteBatch(self)
+
+    def transaction(self, max_attempts=5, **kwargs):
+        return FakeTransaction(self, max_attempts)
+
+    def get_all(self, refs, field_paths=None, transaction=None, **kwargs):
+        with self._grouped():
+            snapshots = [ref.get(field_paths=field_paths) for ref in refs]
+        yield from snapshots
+
+    def _rpc(self):
+        if not self._in_group:
+            self.rpcs += 1
+
+    @contextmanager
+    def _grouped(self):
+        """Các thao tác bên trong tính chung là một round trip"""
+        self._rpc()
+        outer, self._in_group = self._in_group, True
+        try:
+            yield
+        finally:
+            self._in_group = outer
+
+    def stats(self):
+        return {"reads": self.reads, "writes": self.writes, "queries": self.queries,
+                "commits": self.commits, "bytes_read": self.bytes_read, "aborts": self.aborts,
+                "rpcs": self.rpcs}
+
+def transactional(func):
+    """
+    Thay cho firestore.transactional: chạy rồi commit; với xác suất
+    client.abort_rate lần commit bị tranh chấp và hàm được chạy lại
+    (tối đa max_attempts lần) như thư viện thật.
+    """
+    def wrapper(transaction, *args, **kwargs):
+        client = transaction._client
+        for _ in range(transaction.max_attempts):
+            transaction._ops = []
+            result = func(transaction, *args, **kwargs)
+            if client._random.random() < client.abort_rate:
+                client.aborts += 1
+                continue
+            transaction.commit()
+            return result
+        raise FakeAborted("Transaction bị tranh chấp quá số lần thử")
+    return wrapper
+
+def install_fake_firestore(rooms=None):
+    """Thay db và module firestore trong app.firestore bằng bản giả lập"""
+    import app.firestore as fs
+
+    client = FakeClient()
+    fs.db = client
+    fs.firestore = SimpleNamespace(
+        transactional=transactional,
+        SERVER_TIMESTAMP=SERVER_TIMESTAMP,
+        client=lambda: client,
+    )
+    for room in rooms or []:
+        data = {k: v for k, v in room.items() if k != "id"}
+        client.collection("rooms").document(room["id"]).set(data)
+    return client
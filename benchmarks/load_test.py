@@ -0,0 +1,345 @@
+"""
+Load test: đẩy Update giả lập vào update_queue của Application tạo bằng
+build_application (cùng cấu hình với bot chạy thật, kể cả concurrent_updates)
+với Bot giả (ghi lại các lần gửi), Firestore giả lập (hoặc emulator) và LLM
+giả có độ trễ cấu hình được. In ra throughput và p50/p95/p99 theo từng loại
+update và từng handler.
+
+Chạy:
+    python -m benchmarks.load_test --updates 1000 --rate 200 --llm-latency 0.3
+    FIRESTORE_EMULATOR_HOST=localhost:8080 python -m benchmarks.load_test --emulator
+"""
+import argparse
+import asyncio
+import inspect
+import itertools
+import json
+import logging
+import os
+import random
+import re
+import time
+from collections import Counter, defaultdict, deque
+from datetime import date, timedelta
+from time import perf_counter
+from types import SimpleNamespace
+
+from telegram import Bot, Update
+from telegram.ext import Application, ConversationHandler, TypeHandler
+
+from app.main import ROOMS_DATA, build_application
+from app.inline_search import get_inline_metrics
+from app.openai_helper import get_parse_metrics
+from app.resilience import get_breaker_metrics
+from benchmarks.fakes import install_fake_firestore
+
+BOT_USER = {"id": 999999, "is_bot": True, "first_name": "HelloDalatBot", "username": "hello_dalat_bot"}
+
+class FakeBot(Bot):
+    """Bot không gọi Telegram API, chỉ đếm số request theo endpoint"""
+
+    def __init__(self):
+        super().__init__(token="123456:LOAD-TEST")
+        with self._unfrozen():
+            self.sent = Counter()
+            self._message_ids = itertools.count(1)
+
+    async def _do_post(self, endpoint, data, **kwargs):
+        self.sent[endpoint] += 1
+        if endpoint == "getMe":
+            return BOT_USER
+        if endpoint in ("sendMessage", "editMessageText"):
+            return {
+                "message_id": data.get("message_id") or next(self._message_ids),
+                "date": int(time.time()),
+                "chat": {"id": data.get("chat_id", 0), "type": "private"},
+                "from": BOT_USER,
+                "text": data.get("text", ""),
+            }
+        return True
+
+def install_stub_llm(latency: float) -> None:
+    """Thay ChatCompletion.acreate bằng LLM giả có độ trễ cố định"""
+    import openai
+
+    def fake_booking():
+        check_in = date.today() + timedelta(days=random.randint(1, 60))
+        return {
+            "guest_name": f"Nguyễn Văn {random.randint(1, 10 ** 6)}",
+            "phone": "0912345678",
+            "room_id": random.choice(ROOMS_DATA)["id"],
+            "check_in": check_in.isoformat(),
+            "check_out": (check_in + timedelta(days=random.randint(1, 4))).isoformat(),
+            "price": 1500000,
+            "deposit": 500000,
+        }
+
+    async def acreate(model=None, messages=None, functions=None, **kwargs):
+        await asyncio.sleep(latency)
+        prompt = messages[-1]["content"]
+        count = len(re.findall(r'^\s*\d+\. "', prompt, re.MULTILINE))
+        batched = '"results"' in prompt or (functions and functions[0]["name"] == "save_bookings")
+        if batched:
+            content = {"results": [dict(index=i, **fake_booking()) for i in range(count)]}
+        else:
+            content = fake_booking()
+        payload = json.dumps(content, ensure_ascii=False)
+        if functions:
+            message = {"content": None, "function_call": {"name": functions[0]["name"], "arguments": payload}}
+        else:
+            message = {"content": payload}
+        prompt_tokens = sum(len(m["content"]) for m in messages) // 4 + len(json.dumps(functions or [])) // 4
+        return SimpleNamespace(
+            choices=[SimpleNamespace(message=SimpleNamespace(get=message.get, **message))],
+            usage=SimpleNamespace(prompt_tokens=prompt_tokens, completion_tokens=len(payload) // 4),
+        )
+
+    openai.ChatCompletion.acreate = staticmethod(acreate)
+
+def install_emulator_firestore(rooms):
+    """Dùng Firestore emulator (FIRESTORE_EMULATOR_HOST) thay cho bản giả lập"""
+    from google.cloud import firestore as gcf
+    import app.firestore as fs
+
+    if not os.getenv("FIRESTORE_EMULATOR_HOST"):
+        raise SystemExit("Cần đặt FIRESTORE_EMULATOR_HOST để chạy với emulator")
+    fs.db = gcf.Client(project=os.getenv("GCLOUD_PROJECT", "demo-hello-dalat"))
+    for room in rooms:
+        fs.db.collection("rooms").document(room["id"]).set({k: v for k, v in room.items() if k != "id"})
+    return None
+
+class LatencyStats:
+    def __init__(self):
+        self.samples = defaultdict(list)
+
+    def record(self, name, seconds):
+        self.samples[name].append(seconds)
+
+    @staticmethod
+    def percentile(values, pct):
+        ordered = sorted(values)
+        index = min(len(ordered) - 1, max(0, int(round(pct / 100 * len(ordered))) - 1))
+        return ordered[index]
+
+    def report(self, title, elapsed=None):
+        print(f"\n{title}")
+        header = f"{'':<28} {'count':>7} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9}"
+        if elapsed:
+            header += f" {'req/s':>9}"
+        print(header)
+        for name, values in sorted(self.samples.items()):
+            line = (f"{name:<28} {len(values):>7} "
+                    f"{1000 * self.percentile(values, 50):>9.2f} "
+                    f"{1000 * self.percentile(values, 95):>9.2f} "
+                    f"{1000 * self.percentile(values, 99):>9.2f}")
+            if elapsed:
+                line += f" {len(values) / elapsed:>9.1f}"
+            print(line)
+
+def instrument_handlers(app: Application, stats: LatencyStats) -> None:
+    """Bọc callback của mọi handler (kể cả trong ConversationHandler) để đo thời gian"""
+    def wrap(handler):
+        if isinstance(handler, ConversationHandler):
+            nested = handler.entry_points + handler.fallbacks
+            for state_handlers in handler.states.values():
+                nested += state_handlers
+            for inner in nested:
+                wrap(inner)
+            return
+        callback = handler.callback
+        name = getattr(callback, "__name__", repr(callback))
+
+        async def timed(update, context):
+            start = perf_counter()
+            try:
+                result = callback(update, context)
+                if inspect.isawaitable(result):
+                    result = await result
+                return result
+            finally:
+                stats.record(name, perf_counter() - start)
+
+        handler.callback = timed
+
+    for handlers in app.handlers.values():
+        for handler in handlers:
+            wrap(handler)
+
+class UpdateFactory:
+    """Sinh Update giống thực tế: lệnh, callback từ menu /start và tin nhắn tự nhiên"""
+
+    COMMANDS = ["/start", "/help", "/today", "/check", "/schedule 101 {d1} {d2}", "/book"]
+    CALLBACKS = ["book", "check", "cancel", "today"]
+    BOOKINGS = [
+        "Đặt phòng {room} cho {name} từ {d1s} đến {d2s} giá 1.500.000, cọc 500k",
+        "đặt phòng {room} cho khách {name} sđt 0912345678 ngày {d1s} - {d2s}",
+        "Book phòng {room} cho {name} từ {d1s} đến {d2s}, cọc 300k",
+    ]
+    AVAILABILITY = ["Phòng trống từ {d1v} đến {d2v}?", "còn phòng nào trống {d1v} {d2v} không"]
+    INLINE = ["{n1s} {n2s}", "{n1s} {n2s} family", "{n1s} double", "", "{d1s} {d2s} 2"]
+
+    def __init__(self, bot, chats, mix):
+        self.bot = bot
+        self.chats = chats
+        self.mix = mix
+        self._update_ids = itertools.count(1)
+        self._message_ids = itertools.count(1)
+        self._counter = itertools.count(1)
+
+    def _user(self, chat_id):
+        return {"id": chat_id, "is_bot": False, "first_name": f"Khách {chat_id}"}
+
+    def _message(self, chat_id, text, entities=None, from_user=None):
+        message = {
+            "message_id": next(self._message_ids),
+            "date": int(time.time()),
+            "chat": {"id": chat_id, "type": "private"},
+            "from": from_user or self._user(chat_id),
+            "text": text,
+        }
+        if entities:
+            message["entities"] = entities
+        return message
+
+    def _dates(self):
+        d1 = date.today() + timedelta(days=random.randint(1, 60))
+        d2 = d1 + timedelta(days=random.randint(1, 4))
+        # Khoảng ngày gần (người dùng inline thường hỏi vài ngày tới)
+        n1 = date.today() + timedelta(days=random.randint(0, 13))
+        n2 = n1 + timedelta(days=random.randint(1, 3))
+        return {
+            "d1": d1.isoformat(), "d2": d2.isoformat(),
+            "n1s": n1.strftime("%d/%m"), "n2s": n2.strftime("%d/%m"),
+            "d1s": d1.strftime("%d/%m"), "d2s": d2.strftime("%d/%m"),
+            "d1v": d1.strftime("%d/%m/%Y"), "d2v": d2.strftime("%d/%m/%Y"),
+        }
+
+    def make(self):
+        kind = random.choices(list(self.mix), weights=list(self.mix.values()))[0]
+        chat_id = random.randint(1, self.chats)
+        data = {"update_id": next(self._update_ids)}
+        values = dict(self._dates(), room=random.choice(ROOMS_DATA)["id"],
+                      name=f"Trần Thị {next(self._counter)}")
+        if kind == "command":
+            text = random.choice(self.COMMANDS).format(**values)
+            command = text.split()[0]
+            label = command
+            data["message"] = self._message(
+                chat_id, text, [{"type": "bot_command", "offset": 0, "length": len(command)}]
+            )
+        elif kind == "callback":
+            callback_data = random.choice(self.CALLBACKS)
+            label = f"callback:{callback_data}"
+            data["callback_query"] = {
+                "id": str(data["update_id"]),
+                "from": self._user(chat_id),
+                "chat_instance": str(chat_id),
+                "data": callback_data,
+                "message": self._message(chat_id, "🏨 Hello Dalat Hostel Booking System", from_user=BOT_USER),
+            }
+        elif kind == "inline":
+            label = "inline"
+            data["inline_query"] = {
+                "id": str(data["update_id"]),
+                "from": self._user(chat_id),
+                "query": random.choice(self.INLINE).format(**values),
+                "offset": "",
+            }
+        elif kind == "booking":
+            label = "text:booking"
+            data["message"] = self._message(chat_id, random.choice(self.BOOKINGS).format(**values))
+        else:
+            label = "text:availability"
+            data["message"] = self._message(chat_id, random.choice(self.AVAILABILITY).format(**values))
+        return label, Update.de_json(data, self.bot)
+
+async def run(args):
+    random.seed(args.seed)
+    # app.main gọi basicConfig ở mức INFO; tắt log để không ảnh hưởng số đo
+    logging.getLogger().setLevel(logging.CRITICAL)
+    for name in ("app", "telegram", "httpx"):
+        logging.getLogger(name).setLevel(logging.CRITICAL)
+
+    client = install_emulator_firestore(ROOMS_DATA) if args.emulator else install_fake_firestore(ROOMS_DATA)
+    install_stub_llm(args.llm_latency)
+
+    bot = FakeBot()
+    app = build_application(bot=bot)
+
+    handler_stats = LatencyStats()
+    update_stats = LatencyStats()
+    errors = Counter()
+
+    async def on_error(update, context):
+        errors[type(context.error).__name__] += 1
+
+    app.add_error_handler(on_error)
+    instrument_handlers(app, handler_stats)
+
+    # (loại update, thời điểm đưa vào hàng đợi) theo update; update gửi lại dùng chung object
+    in_flight = defaultdict(deque)
+
+    async def completed(update, context):
+        label, scheduled = in_flight[id(update)].popleft()
+        update_stats.record(label, perf_counter() - scheduled)
+
+    # Nhóm cuối cùng: chạy sau mọi handler của update
+    app.add_handler(TypeHandler(object, completed), group=100)
+    await app.initialize()
+    await app.start()
+
+    mix = {"command": args.commands, "callback": args.callbacks,
+           "booking": args.bookings, "availability": args.availability, "inline": args.inline}
+    factory = UpdateFactory(bot, args.chats, mix)
+    updates = [factory.make() for _ in range(args.updates)]
+    # Một phần update bị Telegram gửi lại
+    for _ in range(int(args.updates * args.redelivery)):
+        updates.insert(random.randint(0, len(updates)), random.choice(updates))
+
+    start = perf_counter()
+    for i, (label, update) in enumerate(updates):
+        scheduled = start + i / args.rate if args.rate else perf_counter()
+        delay = scheduled - perf_counter()
+        if delay > 0:
+            await asyncio.sleep(delay)
+        in_flight[id(update)].append((label, scheduled))
+        await app.update_queue.put(update)
+    await app.update_queue.join()
+    elapsed = perf_counter() - start
+    await app.stop()
+    await app.shutdown()
+
+    print(f"Đã xử lý {len(updates)} update trong {elapsed:.2f}s "
+          f"({len(updates) / elapsed:.1f} update/s, {args.chats} chat, "
+          f"concurrent_updates {app.concurrent_updates})")
+    update_stats.report("Độ trễ end-to-end theo loại update (tính cả thời gian chờ):", elapsed)
+    handler_stats.report("Thời gian chạy theo handler:")
+    print(f"\nTelegram API: {dict(bot.sent)}")
+    if client is not None:
+        print(f"Firestore: {client.stats()}")
+    print(f"Circuit breaker: {get_breaker_metrics()}")
+    print(f"Inline: {get_inline_metrics()}")
+    parse = get_parse_metrics()
+    print(f"Gộp ChatGPT: batches={parse['batches']}, items={parse['items']}, "
+          f"max_batch_size={parse['max_batch_size']}, fallbacks={parse['fallbacks']}")
+    if errors:
+        print(f"Lỗi: {dict(errors)}")
+
+def main():
+    parser = argparse.ArgumentParser(description="Load test cho Telegram bot")
+    parser.add_argument("--updates", type=int, default=1000, help="Số update sinh ra")
+    parser.add_argument("--rate", type=float, default=200, help="Update/giây (0 = tối đa)")
+    parser.add_argument("--chats", type=int, default=500, help="Số chat khác nhau")
+    parser.add_argument("--llm-latency", type=float, default=0.3, help="Độ trễ LLM giả (giây)")
+    parser.add_argument("--redelivery", type=float, default=0.02, help="Tỉ lệ update bị gửi lại")
+    parser.add_argument("--commands", type=float, default=0.3, help="Tỉ trọng lệnh")
+    parser.add_argument("--callbacks", type=float, default=0.2, help="Tỉ trọng callback")
+    parser.add_argument("--bookings", type=float, default=0.3, help="Tỉ trọng tin nhắn đặt phòng")
+    parser.add_argument("--availability", type=float, default=0.2, help="Tỉ trọng hỏi phòng trống")
+    parser.add_argument("--inline", type=float, default=0.2, help="Tỉ trọng inline query")
+    parser.add_argument("--emulator", action="store_true", help="Dùng Firestore emulator")
+    parser.add_argument("--seed", type=int, default=42)
+    asyncio.run(run(parser.parse_args()))
+
+if __name__ == "__main__":
+    main()
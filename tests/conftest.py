@@ -0,0 +1,16 @@
+import pytest
+
+from app.main import ROOMS_DATA
+from benchmarks.fakes import install_fake_firestore
+
+@pytest.fixture
+def fake_db(monkeypatch):
+    """Firestore giả lập với danh mục phòng mẫu và cache trống; khôi phục lại sau mỗi test"""
+    import app.cache as cache
+    import app.firestore as fs
+
+    # Ghi nhận giá trị cũ để monkeypatch khôi phục sau khi install_fake_firestore ghi đè
+    monkeypatch.setattr(fs, "db", fs.db)
+    monkeypatch.setattr(fs, "firestore", fs.firestore)
+    monkeypatch.setattr(cache, "_caches", {})
+    return install_fake_firestore(ROOMS_DATA)
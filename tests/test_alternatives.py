@@ -0,0 +1,74 @@
+from datetime import date, timedelta
+
+from app.alternatives import _OTHER_TYPE_PENALTY, find_alternatives
+
+START = date.today() + timedelta(days=30)
+
+def _day(offset: int) -> str:
+    return (START + timedelta(days=offset)).isoformat()
+
+def _book(db, room_id, check_in, check_out):
+    db.collection("bookings").document().set({
+        "roomId": room_id, "guestName": "Khách", "phone": "0912345678",
+        "checkIn": check_in, "checkOut": check_out, "price": 0, "deposit": 0,
+        "status": "confirmed", "notes": "",
+    })
+
+def _block_all_except(db, free_rooms):
+    for room_id in ("101", "102", "103", "201", "202", "203", "301", "302"):
+        if room_id not in free_rooms:
+            _book(db, room_id, _day(-10), _day(10))
+
+def _rooms(suggestion):
+    return [(r["room_id"], r["check_in"], r["check_out"]) for r in suggestion["rooms"]]
+
+def test_split_between_two_rooms(fake_db):
+    _block_all_except(fake_db, {"101", "201"})
+    # 101 trống tới đêm đầu, 201 trống từ đêm thứ hai
+    _book(fake_db, "101", _day(2), _day(4))
+    _book(fake_db, "201", _day(-2), _day(0))
+
+    suggestions = find_alternatives(_day(0), _day(2), flex_days=0, limit=50)
+
+    splits = [_rooms(s) for s in suggestions if s["kind"] == "split"]
+    assert splits == [[("101", _day(0), _day(1)), ("201", _day(1), _day(2))]]
+
+def test_shorter_stay_inside_requested_dates(fake_db):
+    _block_all_except(fake_db, {"101"})
+    _book(fake_db, "101", _day(2), _day(4))
+
+    suggestions = find_alternatives(_day(0), _day(3), flex_days=0, limit=50)
+
+    assert [s["kind"] for s in suggestions] == ["shorter"]
+    assert _rooms(suggestions[0]) == [("101", _day(0), _day(1))]
+
+def test_shift_keeps_number_of_nights(fake_db):
+    _block_all_except(fake_db, {"101"})
+    _book(fake_db, "101", _day(-3), _day(0))
+
+    suggestions = find_alternatives(_day(0), _day(2), flex_days=2, limit=50)
+
+    shifts = [_rooms(s) for s in suggestions if s["kind"] == "shift"]
+    assert shifts == [[("101", _day(1), _day(3))], [("101", _day(2), _day(4))]]
+
+def test_never_suggests_unbookable_rooms(fake_db):
+    fake_db.collection("rooms").document("203").update({"status": "maintenance"})
+    _block_all_except(fake_db, {"203", "101"})
+    _book(fake_db, "101", _day(1), _day(2))
+
+    suggestions = find_alternatives(_day(0), _day(2), limit=50)
+
+    assert suggestions
+    assert all(r["room_id"] != "203" for s in suggestions for r in s["rooms"])
+
+def test_requested_room_type_ranks_first(fake_db):
+    _book(fake_db, "103", _day(0), _day(2))
+
+    suggestions = find_alternatives(_day(0), _day(2), room_id="103", limit=50)
+
+    same_dates = [s for s in suggestions if s["kind"] == "same_dates"]
+    assert _rooms(same_dates[0]) == [("203", _day(0), _day(2))]
+    # Phòng khác loại vẫn được gợi ý, nhưng bị cộng điểm phạt
+    others = [s for s in same_dates if s["rooms"][0]["type"] != "Deluxe Double"]
+    assert others and all(s["score"] == _OTHER_TYPE_PENALTY for s in others)
+    assert all(r["room_id"] != "103" for s in same_dates for r in s["rooms"])
@@ -0,0 +1,37 @@
+import threading
+import time
+from types import SimpleNamespace
+
+import app.cache as cache
+from app.cache import PropertyCache
+
+def test_availability_round_trip_and_invalidate():
+    property_cache = PropertyCache("p1")
+    property_cache.set_availability(("available", "a", "b"), ["101"])
+
+    assert property_cache.get_availability(("available", "a", "b")) == ["101"]
+    property_cache.invalidate_availability(["101"])
+
+    assert property_cache.get_availability(("available", "a", "b")) is None
+    # Kết quả gần nhất vẫn được giữ cho lúc Firestore gặp sự cố
+    assert property_cache.get_last_known(("available", "a", "b")) == ["101"]
+
+def test_invalidate_from_another_thread_waits_for_a_read(monkeypatch):
+    property_cache = PropertyCache("p1")
+    key = ("available", "a", "b")
+    property_cache.set_availability(key, ["101"])
+    sweeper = threading.Thread(target=property_cache.invalidate_availability)
+
+    def monotonic():
+        # Job dọn booking xóa cache đúng lúc get_availability đã đọc entry
+        if sweeper.ident is None:
+            sweeper.start()
+            sweeper.join(0.05)
+        return time.monotonic()
+
+    monkeypatch.setattr(cache, "time", SimpleNamespace(monotonic=monotonic))
+
+    assert property_cache.get_availability(key) == ["101"]
+    sweeper.join(1)
+    assert not sweeper.is_alive()
+    assert property_cache.get_availability(key) is None
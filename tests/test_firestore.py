@@ -0,0 +1,158 @@
+from datetime import date, datetime, timedelta, timezone
+
+import pytest
+
+from app.firestore import (
+    SHIFT_FIELD, _coerce_updates, expire_stale_pending_bookings, reconcile_room_statuses, update_bookings
+)
+
+TODAY = date(2024, 12, 1)
+
+def test_coerce_updates_normalizes_values():
+    updates = {
+        "checkIn": "28/12", "checkOut": "02/01", "price": "1tr5", "deposit": "500.000 đồng",
+        "guestName": " Lê Thị Hoa ", "phone": "0987654321",
+    }
+    assert _coerce_updates(updates, TODAY) == {
+        "checkIn": "2024-12-28", "checkOut": "2025-01-02", "price": 1500000, "deposit": 500000,
+        "guestName": "Lê Thị Hoa", "phone": "0987654321",
+    }
+
+def test_coerce_updates_shift_days():
+    assert _coerce_updates({SHIFT_FIELD: " -2 "}, TODAY) == {SHIFT_FIELD: -2}
+
+@pytest.mark.parametrize("updates", [
+    {},
+    {"status": "cancelled"},
+    {SHIFT_FIELD: "2", "checkIn": "2024-12-25"},
+    {SHIFT_FIELD: "hai"},
+    {"price": ""},
+    {"deposit": None},
+    {"price": -100},
+    {"price": "miễn phí"},
+    {"checkIn": "32/12"},
+    {"guestName": "  "},
+])
+def test_coerce_updates_rejects_invalid(updates):
+    with pytest.raises(ValueError):
+        _coerce_updates(updates, TODAY)
+
+def _add_booking(db, room_id, check_in, check_out, status="confirmed"):
+    ref = db.collection("bookings").document()
+    ref.set({
+        "roomId": room_id, "guestName": "Khách", "phone": "0912345678",
+        "checkIn": check_in, "checkOut": check_out, "price": 0, "deposit": 0,
+        "status": status, "notes": "",
+    })
+    return ref.id
+
+def _dates(db, booking_id):
+    data = db.collection("bookings").document(booking_id).get().to_dict()
+    return data["checkIn"], data["checkOut"]
+
+def _day(offset: int) -> str:
+    return (date.today() + timedelta(days=30 + offset)).isoformat()
+
+def test_update_bookings_rejects_move_into_other_booking(fake_db):
+    moving = _add_booking(fake_db, "101", _day(0), _day(2))
+    _add_booking(fake_db, "101", _day(5), _day(7))
+    commits = fake_db.stats()["commits"]
+
+    with pytest.raises(ValueError, match="đã có booking"):
+        update_bookings({moving: {"checkIn": _day(4), "checkOut": _day(6)}})
+
+    assert _dates(fake_db, moving) == (_day(0), _day(2))
+    assert fake_db.stats()["commits"] == commits
+
+def test_update_bookings_shifts_back_to_back_group(fake_db):
+    group = [
+        _add_booking(fake_db, room_id, _day(offset), _day(offset + 2))
+        for room_id in ("101", "102") for offset in (0, 3)
+    ]
+
+    written = update_bookings({booking_id: {SHIFT_FIELD: 1} for booking_id in group})
+
+    assert set(written) == set(group)
+    assert [_dates(fake_db, booking_id) for booking_id in group] == [
+        (_day(1), _day(3)), (_day(4), _day(6)), (_day(1), _day(3)), (_day(4), _day(6)),
+    ]
+
+def test_update_bookings_unmoved_sibling_still_blocks(fake_db):
+    moving = _add_booking(fake_db, "101", _day(0), _day(2))
+    sibling = _add_booking(fake_db, "101", _day(3), _day(5))
+
+    with pytest.raises(ValueError, match=sibling):
+        update_bookings({moving: {SHIFT_FIELD: 2}, sibling: {"notes": "Đoàn"}})
+
+def test_update_bookings_ignores_cancelled_bookings(fake_db):
+    moving = _add_booking(fake_db, "101", _day(0), _day(2))
+    _add_booking(fake_db, "101", _day(3), _day(5), status="cancelled")
+
+    update_bookings({moving: {SHIFT_FIELD: 3}})
+
+    assert _dates(fake_db, moving) == (_day(3), _day(5))
+
+def test_update_bookings_writes_everything_in_one_commit(fake_db):
+    ids = [_add_booking(fake_db, room_id, _day(0), _day(2)) for room_id in ("101", "102", "103")]
+    commits = fake_db.stats()["commits"]
+
+    update_bookings({
+        ids[0]: {SHIFT_FIELD: 1},
+        ids[1]: {"price": "1tr5", "deposit": "500k"},
+        ids[2]: {"checkOut": _day(3), "notes": "Ở thêm"},
+    })
+
+    assert fake_db.stats()["commits"] == commits + 1
+    assert _dates(fake_db, ids[0]) == (_day(1), _day(3))
+    assert _dates(fake_db, ids[2]) == (_day(0), _day(3))
+    data = fake_db.collection("bookings").document(ids[1]).get().to_dict()
+    assert (data["price"], data["deposit"]) == (1500000, 500000)
+
+def _add_pending(db, room_id, age_seconds):
+    booking_id = _add_booking(db, room_id, _day(0), _day(2), status="pending")
+    created_at = datetime.now(timezone.utc) - timedelta(seconds=age_seconds)
+    db.collection("bookings").document(booking_id).update({"createdAt": created_at})
+    return booking_id
+
+def _status(db, collection, doc_id):
+    return db.collection(collection).document(doc_id).get().to_dict()["status"]
+
+def test_expire_stale_pending_bookings_pages_past_page_size(fake_db):
+    stale = [_add_pending(fake_db, "101", 3600 + i) for i in range(5)]
+    fresh = _add_pending(fake_db, "102", 60)
+    confirmed = _add_booking(fake_db, "103", _day(0), _day(2))
+    commits = fake_db.stats()["commits"]
+
+    assert expire_stale_pending_bookings(ttl_seconds=1800, page_size=2) == 5
+
+    assert [_status(fake_db, "bookings", booking_id) for booking_id in stale] == ["expired"] * 5
+    assert _status(fake_db, "bookings", fresh) == "pending"
+    assert _status(fake_db, "bookings", confirmed) == "confirmed"
+    # Mỗi trang một batch: 2 + 2 + 1
+    assert fake_db.stats()["commits"] == commits + 3
+
+def test_expire_stale_pending_bookings_without_stale_rows(fake_db):
+    fresh = _add_pending(fake_db, "101", 60)
+    commits = fake_db.stats()["commits"]
+
+    assert expire_stale_pending_bookings(ttl_seconds=1800, page_size=2) == 0
+
+    assert _status(fake_db, "bookings", fresh) == "pending"
+    assert fake_db.stats()["commits"] == commits
+
+def test_reconcile_room_statuses_fixes_only_available_and_booked(fake_db):
+    rooms = fake_db.collection("rooms")
+    rooms.document("101").update({"status": "booked"})
+    rooms.document("103").update({"status": "maintenance"})
+    rooms.document("203").update({"status": "cleaning"})
+    _add_booking(fake_db, "102", _day(0), _day(2))
+    _add_booking(fake_db, "103", _day(0), _day(2))
+    _add_booking(fake_db, "202", _day(0), _day(2), status="cancelled")
+
+    assert reconcile_room_statuses() == 2
+
+    assert _status(fake_db, "rooms", "101") == "available"
+    assert _status(fake_db, "rooms", "102") == "booked"
+    assert _status(fake_db, "rooms", "202") == "available"
+    assert _status(fake_db, "rooms", "103") == "maintenance"
+    assert _status(fake_db, "rooms", "203") == "cleaning"
@@ -0,0 +1,129 @@
+import asyncio
+from collections import OrderedDict
+from datetime import date, timedelta
+
+import pytest
+
+import app.idempotency as idempotency
+from app.firestore import cancel_booking, create_booking
+from app.idempotency import forget_booking, make_keys, run_once
+
+CHECK_IN = date.today() + timedelta(days=10)
+
+@pytest.fixture(autouse=True)
+def clean_state(monkeypatch):
+    monkeypatch.setattr(idempotency, "_local", OrderedDict())
+    monkeypatch.setattr(idempotency, "_inflight", {})
+
+@pytest.fixture
+def records(monkeypatch):
+    """Bản ghi idempotency giả trên Firestore: key -> kết quả"""
+    records = {}
+
+    def get_record(keys):
+        for key in keys:
+            if key in records:
+                return records[key]
+        return None
+
+    monkeypatch.setattr(idempotency, "get_idempotency_record", get_record)
+    return records
+
+def _result(booking_id):
+    return {"booking_id": booking_id, "room_id": "101", "guest_name": "Khách", "deposit": 500000}
+
+def _creator(calls, result=None, error=None, delay=0.05):
+    async def create():
+        calls.append(1)
+        await asyncio.sleep(delay)
+        if error is not None:
+            raise error
+        return result
+    return create
+
+def test_redelivered_update_waits_for_the_running_request(records):
+    calls = []
+    create = _creator(calls, _result("b1"))
+
+    async def run():
+        first = asyncio.ensure_future(run_once(["u_1", "c_a"], create))
+        await asyncio.sleep(0)
+        # Telegram gửi lại cùng update trong lúc request đầu chưa xong
+        second = asyncio.ensure_future(run_once(["u_1", "c_b"], create))
+        return await asyncio.gather(first, second)
+
+    (first, first_dup), (second, second_dup) = asyncio.run(run())
+
+    assert calls == [1]
+    assert first == second == _result("b1")
+    assert (first_dup, second_dup) == (False, True)
+    assert idempotency._inflight == {}
+
+def test_exception_reaches_the_waiting_duplicate(records):
+    calls = []
+    create = _creator(calls, error=ValueError("Phòng đã có người đặt"))
+
+    async def run():
+        first = asyncio.ensure_future(run_once(["u_1"], create))
+        await asyncio.sleep(0)
+        second = asyncio.ensure_future(run_once(["u_1"], create))
+        return await asyncio.gather(first, second, return_exceptions=True)
+
+    results = asyncio.run(run())
+
+    assert calls == [1]
+    assert all(isinstance(r, ValueError) for r in results)
+    # Lỗi không được ghi nhớ: gửi lại sẽ chạy lại
+    assert idempotency._local == {} and idempotency._inflight == {}
+
+def test_local_hit_skips_firestore_and_create(monkeypatch):
+    calls = []
+    asyncio.run(run_once(["u_1", "c_a"], _creator(calls, _result("b1"), delay=0)))
+    monkeypatch.setattr(idempotency, "get_idempotency_record", lambda keys: pytest.fail("không cần tra Firestore"))
+
+    result, duplicate = asyncio.run(run_once(["u_2", "c_a"], _creator(calls, _result("b2"), delay=0)))
+
+    assert (result, duplicate) == (_result("b1"), True)
+    assert calls == [1]
+
+def test_firestore_hit_is_cached_locally(records):
+    records["c_a"] = _result("b1")
+    calls = []
+
+    result, duplicate = asyncio.run(run_once(["u_2", "c_a"], _creator(calls, _result("b2"))))
+
+    assert (result, duplicate) == (_result("b1"), True)
+    assert calls == []
+    assert idempotency._get_local(["u_2"]) == _result("b1")
+
+def test_forget_booking_drops_only_its_keys(records):
+    asyncio.run(run_once(["u_1", "c_a"], _creator([], _result("b1"), delay=0)))
+    asyncio.run(run_once(["u_2", "c_b"], _creator([], _result("b2"), delay=0)))
+
+    forget_booking("b1")
+
+    assert list(idempotency._local) == ["u_2", "c_b"]
+
+def test_resending_after_cancel_creates_a_new_booking(fake_db):
+    booking = {
+        "room_id": "101", "guest_name": "Khách", "phone": "0912345678",
+        "check_in": CHECK_IN.isoformat(), "check_out": (CHECK_IN + timedelta(days=2)).isoformat(),
+        "price": 1500000, "deposit": 500000,
+    }
+    text = "Đặt phòng 101 cho Khách"
+
+    async def book(update_id):
+        async def create():
+            return _result(create_booking(booking, make_keys(1, update_id, text)))
+        return await run_once(make_keys(1, update_id, text), create)
+
+    (first, _), (same, duplicate) = asyncio.run(book(1)), asyncio.run(book(2))
+    assert duplicate and same["booking_id"] == first["booking_id"]
+
+    assert cancel_booking(first["booking_id"])
+    forget_booking(first["booking_id"])
+    assert list(fake_db.collection("idempotency_keys").stream()) == []
+
+    second, duplicate = asyncio.run(book(3))
+    assert not duplicate
+    assert second["booking_id"] != first["booking_id"]
@@ -0,0 +1,29 @@
+from datetime import date
+
+import pytest
+
+from app.inline_search import parse_inline_query
+
+TODAY = date(2024, 12, 1)
+
+@pytest.mark.parametrize("query, expected", [
+    ("", ("2024-12-01", "2024-12-02", [])),
+    ("25/12", ("2024-12-25", "2024-12-26", [])),
+    ("25/12 27/12 Family", ("2024-12-25", "2024-12-27", ["family"])),
+    ("28/12 02/01 2", ("2024-12-28", "2025-01-02", ["2"])),
+    ("2024-12-10 12/12/2024 double", ("2024-12-10", "2024-12-12", ["double"])),
+    # Ngày đang gõ dở bị bỏ qua, không thành từ khóa
+    ("25/12 27/", ("2024-12-25", "2024-12-26", [])),
+])
+def test_parse_inline_query(query, expected):
+    assert parse_inline_query(query, TODAY) == expected
+
+@pytest.mark.parametrize("query", [
+    "2024-11-30",
+    "25/12 26/12 27/12",
+    "25/12 25/12",
+    "2024-12-27 2024-12-25",
+])
+def test_parse_inline_query_rejects_invalid(query):
+    with pytest.raises(ValueError):
+        parse_inline_query(query, TODAY)
@@ -0,0 +1,31 @@
+from app.intervals import fits, free_gaps, gap_containing, ordinal_to_str, to_ordinal
+
+def _gaps(busy, start, end):
+    gaps = free_gaps(busy, start, end)
+    return gaps, [gap[0] for gap in gaps]
+
+def test_free_gaps_without_bookings_is_whole_window():
+    assert free_gaps([], 10, 20) == [(10, 20)]
+
+def test_free_gaps_treats_both_booking_ends_as_busy():
+    assert free_gaps([(12, 14)], 10, 20) == [(10, 11), (15, 20)]
+
+def test_free_gaps_merges_overlapping_and_unsorted_bookings():
+    assert free_gaps([(16, 17), (12, 14), (13, 15)], 10, 20) == [(10, 11), (18, 20)]
+
+def test_free_gaps_clips_bookings_outside_window():
+    assert free_gaps([(1, 5), (8, 11), (19, 25), (30, 31)], 10, 20) == [(12, 18)]
+
+def test_free_gaps_fully_booked_window():
+    assert free_gaps([(5, 25)], 10, 20) == []
+
+def test_gap_containing_and_fits():
+    gaps, starts = _gaps([(12, 14)], 10, 20)
+    assert gap_containing(gaps, starts, 11) == (10, 11)
+    assert gap_containing(gaps, starts, 13) is None
+    assert gap_containing(gaps, starts, 9) is None
+    assert fits(gaps, starts, 15, 20)
+    assert not fits(gaps, starts, 10, 12)
+
+def test_ordinal_round_trip():
+    assert ordinal_to_str(to_ordinal("2024-12-31") + 1) == "2025-01-01"
@@ -0,0 +1,118 @@
+import asyncio
+import json
+import re
+from datetime import date, timedelta
+from types import SimpleNamespace
+
+import pytest
+
+import app.openai_helper as openai_helper
+from app.openai_helper import ParseBatcher
+
+CHECK_IN = date.today() + timedelta(days=10)
+
+def _booking(text):
+    return {
+        "guest_name": text, "phone": "0912345678", "room_id": "101",
+        "check_in": CHECK_IN.isoformat(), "check_out": (CHECK_IN + timedelta(days=2)).isoformat(),
+        "price": 1500000, "deposit": None if "thiếu cọc" in text else 500000,
+    }
+
+def _response(arguments):
+    message = {"content": None, "function_call": {"name": "save", "arguments": json.dumps(arguments)}}
+    return SimpleNamespace(
+        choices=[SimpleNamespace(message=SimpleNamespace(get=message.get, **message))],
+        usage=SimpleNamespace(prompt_tokens=10, completion_tokens=10),
+    )
+
+@pytest.fixture
+def llm(monkeypatch):
+    """ChatGPT giả: ghi lại số tin nhắn của mỗi lần gọi, trả kết quả gộp theo thứ tự ngược"""
+    calls = []
+
+    async def chat_completion(**kwargs):
+        content = kwargs["messages"][-1]["content"]
+        await asyncio.sleep(0.02)
+        if kwargs["functions"][0]["name"] != "save_bookings":
+            calls.append([content])
+            return _response(_booking(content))
+        texts = re.findall(r'^(\d+)\. "(.*)"$', content, re.MULTILINE)
+        calls.append([text for _, text in texts])
+        results = [
+            dict(_booking(text), index=int(index))
+            for index, text in reversed(texts) if "bỏ sót" not in text
+        ]
+        return _response({"results": results})
+
+    monkeypatch.setattr(openai_helper, "BOOKING_PROMPT_VERSION", "structured")
+    monkeypatch.setattr(openai_helper, "_chat_completion", chat_completion)
+    return calls
+
+async def _submit_all(batcher, texts):
+    # Tin nhắn đầu tiên được gửi ngay; các tin nhắn sau đến khi nó đang chạy nên được gộp
+    first = asyncio.ensure_future(batcher.submit(texts[0]))
+    await asyncio.sleep(0)
+    rest = [asyncio.ensure_future(batcher.submit(text)) for text in texts[1:]]
+    return await asyncio.gather(first, *rest, return_exceptions=True)
+
+def test_single_message_is_sent_without_waiting(llm):
+    batcher = ParseBatcher(window=10, max_size=8)
+
+    result = asyncio.run(asyncio.wait_for(batcher.submit("Khách A"), timeout=1))
+
+    assert result["guest_name"] == "Khách A"
+    assert llm == [["Khách A"]]
+
+def test_batch_results_fan_out_by_index(llm):
+    batcher = ParseBatcher(window=10, max_size=8)
+    texts = ["Khách A", "Khách B", "Khách C", "Khách D"]
+
+    results = asyncio.run(_submit_all(batcher, texts))
+
+    assert [r["guest_name"] for r in results] == texts
+    assert llm == [["Khách A"], ["Khách B", "Khách C", "Khách D"]]
+    assert batcher.metrics["max_batch_size"] == 3
+
+def test_missing_item_is_parsed_again_alone(llm):
+    batcher = ParseBatcher(window=10, max_size=8)
+    texts = ["Khách A", "Khách B", "Khách C bỏ sót"]
+
+    results = asyncio.run(_submit_all(batcher, texts))
+
+    assert [r["guest_name"] for r in results] == texts
+    assert llm[-1] == ["Khách C bỏ sót"]
+    assert batcher.metrics["fallbacks"] == 1
+
+def test_incomplete_item_fails_without_another_call(llm):
+    batcher = ParseBatcher(window=10, max_size=8)
+    texts = ["Khách A", "Khách B thiếu cọc", "Khách C"]
+
+    results = asyncio.run(_submit_all(batcher, texts))
+
+    assert isinstance(results[1], ValueError) and "deposit" in str(results[1])
+    assert [results[0]["guest_name"], results[2]["guest_name"]] == ["Khách A", "Khách C"]
+    assert llm == [["Khách A"], ["Khách B thiếu cọc", "Khách C"]]
+    assert batcher.metrics["fallbacks"] == 0
+
+def test_max_size_flushes_without_waiting_for_window(llm):
+    batcher = ParseBatcher(window=10, max_size=2)
+    texts = ["Khách A", "Khách B", "Khách C"]
+
+    results = asyncio.run(asyncio.wait_for(_submit_all(batcher, texts), timeout=1))
+
+    assert [r["guest_name"] for r in results] == texts
+    assert llm == [["Khách A"], ["Khách B", "Khách C"]]
+
+def test_legacy_prompt_result_is_validated(monkeypatch):
+    async def chat_completion(**kwargs):
+        payload = dict(_booking("Khách A"), price="1.500.000", deposit="500k")
+        message = {"content": json.dumps(payload)}
+        return SimpleNamespace(
+            choices=[SimpleNamespace(message=SimpleNamespace(get=message.get, **message))], usage=None
+        )
+
+    monkeypatch.setattr(openai_helper, "_chat_completion", chat_completion)
+
+    result = asyncio.run(openai_helper._parse_single("Khách A", version="legacy"))
+
+    assert (result["price"], result["deposit"]) == (1500000, 500000)
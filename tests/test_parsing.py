@@ -0,0 +1,94 @@
+from datetime import date
+
+import pytest
+
+from app.openai_helper import validate_booking
+from app.parsing import to_date, to_vnd
+
+TODAY = date(2024, 12, 1)
+
+def _booking(**overrides):
+    data = {
+        "guest_name": "Nguyễn Văn A", "phone": "0912345678", "room_id": "101",
+        "check_in": "25/12", "check_out": "27/12", "price": "1.500.000", "deposit": "500k",
+    }
+    data.update(overrides)
+    return data
+
+@pytest.mark.parametrize("value, expected", [
+    (1500000, 1500000),
+    (1500000.0, 1500000),
+    ("1.500.000", 1500000),
+    ("1,500,000", 1500000),
+    ("500k", 500000),
+    ("1tr5", 1500000),
+    ("1,5 triệu", 1500000),
+    ("300 nghìn", 300000),
+    ("200.000đ", 200000),
+    ("500.000 đồng", 500000),
+    ("300000 VND", 300000),
+    (0, 0),
+    ("0", 0),
+])
+def test_to_vnd(value, expected):
+    assert to_vnd(value) == expected
+
+@pytest.mark.parametrize("value", [None, "", "   ", "abc", "1.5.0", True])
+def test_to_vnd_rejects_invalid(value):
+    with pytest.raises(ValueError):
+        to_vnd(value)
+
+@pytest.mark.parametrize("value, expected", [
+    ("2024-12-25", date(2024, 12, 25)),
+    ("25/12/2024", date(2024, 12, 25)),
+    ("25/12", date(2024, 12, 25)),
+    ("01/12", date(2024, 12, 1)),
+    # Ngày thiếu năm đã qua trong năm nay là ngày của năm sau
+    ("02/01", date(2025, 1, 2)),
+    ("30/11", date(2025, 11, 30)),
+])
+def test_to_date(value, expected):
+    assert to_date(value, TODAY) == expected
+
+@pytest.mark.parametrize("value", [None, "", "25-12", "32/12", "hôm nay"])
+def test_to_date_rejects_invalid(value):
+    with pytest.raises(ValueError):
+        to_date(value, TODAY)
+
+def test_validate_booking_normalizes_fields():
+    assert validate_booking(_booking(guest_name=" Nguyễn Văn A "), TODAY) == {
+        "guest_name": "Nguyễn Văn A", "phone": "0912345678", "room_id": "101",
+        "check_in": "2024-12-25", "check_out": "2024-12-27", "price": 1500000, "deposit": 500000,
+    }
+
+def test_validate_booking_rolls_check_out_into_next_year():
+    result = validate_booking(_booking(check_in="28/12", check_out="02/01"), TODAY)
+    assert (result["check_in"], result["check_out"]) == ("2024-12-28", "2025-01-02")
+
+def test_validate_booking_accepts_explicit_zero():
+    result = validate_booking(_booking(price=0, deposit="0"), TODAY)
+    assert (result["price"], result["deposit"]) == (0, 0)
+
+@pytest.mark.parametrize("field", ["price", "deposit", "phone", "guest_name", "room_id"])
+@pytest.mark.parametrize("value", [None, ""])
+def test_validate_booking_rejects_missing_field(field, value):
+    with pytest.raises(ValueError, match=field):
+        validate_booking(_booking(**{field: value}), TODAY)
+
+def test_validate_booking_rejects_absent_key():
+    data = _booking()
+    del data["deposit"]
+    with pytest.raises(ValueError, match="deposit"):
+        validate_booking(data, TODAY)
+
+def test_validate_booking_rejects_past_check_in():
+    with pytest.raises(ValueError, match="đã qua"):
+        validate_booking(_booking(check_in="2024-11-30", check_out="2024-12-02"), TODAY)
+
+def test_validate_booking_rejects_check_out_before_check_in():
+    with pytest.raises(ValueError):
+        validate_booking(_booking(check_in="2024-12-27", check_out="2024-12-25"), TODAY)
+
+def test_validate_booking_rejects_negative_amount():
+    with pytest.raises(ValueError):
+        validate_booking(_booking(deposit=-1), TODAY)
@@ -0,0 +1,30 @@
+import pytest
+
+import app.firestore as fs
+import app.properties as properties
+from app.firestore import DEFAULT_PROPERTY_ID
+
+@pytest.fixture
+def chat_properties(fake_db, monkeypatch):
+    monkeypatch.setattr(properties, "_chat_properties", {})
+    fake_db.collection("chat_properties").document("42").set({"propertyId": "da-lat-2"})
+    return fake_db
+
+def test_bound_chat_uses_its_property(chat_properties):
+    assert properties.get_chat_property(42) == "da-lat-2"
+
+def test_unbound_chat_uses_default_property(chat_properties):
+    assert properties.get_chat_property(7) == DEFAULT_PROPERTY_ID
+    assert properties._chat_properties == {7: DEFAULT_PROPERTY_ID}
+
+def test_lookup_error_is_raised_and_not_cached(chat_properties, monkeypatch):
+    def unavailable(*args, **kwargs):
+        raise TimeoutError("Firestore không phản hồi")
+
+    with monkeypatch.context() as patch:
+        patch.setattr(fs, "_fetch_doc", unavailable)
+        with pytest.raises(TimeoutError):
+            properties.get_chat_property(42)
+
+    assert properties._chat_properties == {}
+    assert properties.get_chat_property(42) == "da-lat-2"
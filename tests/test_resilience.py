@@ -0,0 +1,199 @@
+import time
+from types import SimpleNamespace
+
+import pytest
+
+import app.resilience as resilience
+from app.resilience import (
+    CircuitBreaker, CircuitOpenError, DeadlineExceeded, begin_update, guarded, remaining_timeout
+)
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def monotonic(self):
+        return self.now
+
+@pytest.fixture(autouse=True)
+def no_deadline():
+    begin_update(None)
+    yield
+    begin_update(None)
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(resilience, "time", SimpleNamespace(monotonic=clock.monotonic))
+    return clock
+
+def _breaker(**kwargs):
+    options = dict(window_seconds=30, failure_rate=0.5, min_calls=4, slow_call_seconds=1, open_seconds=10)
+    options.update(kwargs)
+    return CircuitBreaker("test", **options)
+
+def _open(breaker):
+    for _ in range(breaker.min_calls):
+        breaker.record(False, 0.01)
+    assert breaker.state == CircuitBreaker.OPEN
+
+def test_opens_when_failure_rate_reached(clock):
+    breaker = _breaker()
+    for ok in (True, True, False):
+        breaker.record(ok, 0.01)
+    assert breaker.state == CircuitBreaker.CLOSED
+    breaker.record(False, 0.01)
+
+    assert breaker.state == CircuitBreaker.OPEN
+    assert not breaker.allow()
+    assert breaker.metrics["rejected"] == 1
+
+def test_needs_min_calls_before_opening(clock):
+    breaker = _breaker()
+    for _ in range(3):
+        breaker.record(False, 0.01)
+    assert breaker.state == CircuitBreaker.CLOSED
+
+def test_old_failures_leave_the_window(clock):
+    breaker = _breaker()
+    for _ in range(3):
+        breaker.record(False, 0.01)
+    clock.now += 31
+    breaker.record(False, 0.01)
+    assert breaker.state == CircuitBreaker.CLOSED
+    assert breaker.snapshot()["window_calls"] == 1
+
+def test_slow_successful_calls_count_as_failures(clock):
+    breaker = _breaker()
+    for _ in range(4):
+        breaker.record(True, 2)
+    assert breaker.metrics["failures"] == 4
+    assert breaker.state == CircuitBreaker.OPEN
+
+def test_half_open_allows_one_probe_then_closes_on_success(clock):
+    breaker = _breaker()
+    _open(breaker)
+    clock.now += 10
+
+    assert breaker.allow()
+    assert breaker.state == CircuitBreaker.HALF_OPEN
+    assert not breaker.allow()
+    breaker.record(True, 0.01)
+
+    assert breaker.state == CircuitBreaker.CLOSED
+    assert breaker.allow()
+
+def test_half_open_reopens_on_failure(clock):
+    breaker = _breaker()
+    _open(breaker)
+    clock.now += 10
+    assert breaker.allow()
+
+    breaker.record(False, 0.01)
+
+    assert breaker.state == CircuitBreaker.OPEN
+    assert breaker.metrics["opened"] == 2
+    assert not breaker.allow()
+
+def test_guarded_rejects_while_open(clock):
+    breaker = _breaker()
+    _open(breaker)
+    calls = []
+
+    with pytest.raises(CircuitOpenError):
+        guarded(breaker)(lambda: calls.append(1))()
+    assert calls == []
+
+def test_value_errors_are_not_dependency_failures(clock):
+    breaker = _breaker()
+
+    @guarded(breaker)
+    def invalid():
+        raise ValueError("dữ liệu sai")
+
+    for _ in range(4):
+        with pytest.raises(ValueError):
+            invalid()
+    assert breaker.metrics["failures"] == 0
+    assert breaker.state == CircuitBreaker.CLOSED
+
+def _exhausts_budget(clock, breaker):
+    @guarded(breaker)
+    def slow_call():
+        clock.now += 0.2
+        remaining_timeout()
+
+    begin_update(0.1)
+    with pytest.raises(DeadlineExceeded):
+        slow_call()
+
+def test_exhausted_budget_is_not_a_failure(clock):
+    breaker = _breaker()
+    for _ in range(4):
+        _exhausts_budget(clock, breaker)
+    assert breaker.metrics["failures"] == 0
+    assert breaker.state == CircuitBreaker.CLOSED
+
+def test_exhausted_budget_keeps_half_open_breaker_half_open(clock):
+    breaker = _breaker()
+    _open(breaker)
+    clock.now += 10
+
+    _exhausts_budget(clock, breaker)
+
+    assert breaker.state == CircuitBreaker.HALF_OPEN
+    # Lượt gọi thử được giải phóng để update sau thử lại
+    assert breaker.allow()
+
+def test_expired_deadline_skips_dependency_and_breaker(clock):
+    breaker = _breaker()
+    calls = []
+    begin_update(0.1)
+    clock.now += 1
+
+    with pytest.raises(DeadlineExceeded):
+        guarded(breaker)(lambda: calls.append(1))()
+    assert calls == []
+    assert breaker.metrics["calls"] == 0
+
+def test_dependency_timeout_within_budget_is_a_failure(clock):
+    breaker = _breaker()
+
+    @guarded(breaker)
+    def timeout():
+        raise TimeoutError("dependency không phản hồi")
+
+    begin_update(10)
+    with pytest.raises(TimeoutError):
+        timeout()
+    assert breaker.metrics["failures"] == 1
+
+def test_hedged_read_returns_the_faster_copy():
+    breaker = _breaker(slow_call_seconds=5)
+    attempts = []
+
+    @guarded(breaker, hedge=True)
+    def read():
+        attempts.append(1)
+        if len(attempts) == 1:
+            time.sleep(1)
+            return "chậm"
+        return "nhanh"
+
+    started = time.monotonic()
+    assert read() == "nhanh"
+    assert time.monotonic() - started < 0.8
+    assert len(attempts) == 2
+
+def test_hedged_read_respects_deadline():
+    breaker = _breaker(slow_call_seconds=5)
+
+    @guarded(breaker, hedge=True)
+    def read():
+        time.sleep(1)
+
+    begin_update(0.3)
+    started = time.monotonic()
+    with pytest.raises(DeadlineExceeded):
+        read()
+    assert time.monotonic() - started < 0.8
@@ -0,0 +1,44 @@
+import asyncio
+
+from telegram import Update
+from telegram.ext import Application, TypeHandler
+
+from app.telegram_bot import ChatOrderedApplication
+from benchmarks.load_test import FakeBot
+
+def _update(update_id, chat_id):
+    return Update.de_json({
+        "update_id": update_id,
+        "message": {
+            "message_id": update_id, "date": 0, "text": "đặt phòng",
+            "chat": {"id": chat_id, "type": "private"},
+            "from": {"id": chat_id, "is_bot": False, "first_name": "Khách"},
+        },
+    }, None)
+
+def test_updates_run_concurrently_across_chats_but_in_order_within_a_chat():
+    events = []
+
+    async def handle(update, context):
+        events.append(("start", update.update_id))
+        await asyncio.sleep(0.05)
+        events.append(("end", update.update_id))
+
+    async def run():
+        app = (Application.builder().application_class(ChatOrderedApplication)
+               .bot(FakeBot()).updater(None).concurrent_updates(8).build())
+        app.add_handler(TypeHandler(Update, handle))
+        async with app:
+            await app.start()
+            for update in (_update(1, 100), _update(2, 100), _update(3, 200)):
+                await app.update_queue.put(update)
+            await app.update_queue.join()
+            await app.stop()
+        return app
+
+    app = asyncio.run(run())
+
+    # Chat 200 không phải chờ chat 100; update 2 chỉ bắt đầu sau khi update 1 xong
+    assert events.index(("start", 3)) < events.index(("end", 1))
+    assert events.index(("end", 1)) < events.index(("start", 2))
+    assert app._chat_locks == {}